@@ -0,0 +1,324 @@
+"""
+Validation, repair and indexed access for the question JSONL files.
+
+	python dataset.py validate questions.jsonl
+	python dataset.py repair questions.jsonl        # bad lines go to questions.jsonl.quarantine
+	python dataset.py index questions.jsonl
+	python dataset.py select questions.jsonl --category "Classification"
+
+Records are decoded with orjson when it is installed, and with the standard
+json module otherwise. The index is two sidecar files next to the dataset:
+<name>.offsets holds the byte offset of every line (int64), so record i is
+one seek away, and <name>.idx maps each category and pdf_url to its line
+numbers, so filtered reads skip unrelated records without decoding them.
+Lines that validate would report are left out of the index, and their byte
+offsets are kept in .idx as "skipped".
+"""
+import argparse
+import json
+import os
+import sys
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+
+INDEX_VERSION = 2
+INDEXED_FIELDS = ("category", "pdf_url")
+CHUNK_BYTES = 8 << 20
+
+
+def loads(line):
+	if orjson is not None:
+		return orjson.loads(line)
+	return json.loads(line)
+
+
+def dumps(record):
+	if orjson is not None:
+		return orjson.dumps(record)
+	return json.dumps(record).encode("utf-8")
+
+
+def check_line(line):
+	"""
+	None if line is one JSON object, otherwise what is wrong with it.
+	"""
+	if not line.strip():
+		return "blank line"
+	try:
+		record = loads(line)
+	except ValueError as e:
+		return str(e)
+	if not isinstance(record, dict):
+		return f"expected an object, got {type(record).__name__}"
+	return None
+
+
+def chunk_ranges(path, chunk_bytes=CHUNK_BYTES):
+	"""
+	Splits the file into byte ranges of about chunk_bytes that start and end
+	on line boundaries.
+	"""
+	size = os.path.getsize(path)
+	ranges = []
+	start = 0
+	with open(path, "rb") as fp:
+		while start < size:
+			fp.seek(min(start + chunk_bytes, size))
+			fp.readline()
+			end = min(fp.tell(), size)
+			ranges.append((start, end))
+			start = end
+	return ranges
+
+
+def _validate_range(path, start, end):
+	problems = []
+	lines = 0
+	with open(path, "rb") as fp:
+		fp.seek(start)
+		offset = start
+		while offset < end:
+			line = fp.readline()
+			error = check_line(line)
+			if error is not None:
+				problems.append((lines, offset, error, line[:200].decode("utf-8", "replace")))
+			lines += 1
+			offset += len(line)
+	return lines, problems
+
+
+def validate(path, workers=None, chunk_bytes=CHUNK_BYTES):
+	"""
+	[(line number, byte offset, error, start of line)] for every bad line,
+	checked in parallel over chunks of the file.
+	"""
+	ranges = chunk_ranges(path, chunk_bytes)
+	if len(ranges) <= 1 or workers == 1:
+		results = [_validate_range(path, start, end) for start, end in ranges]
+	else:
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			results = list(pool.map(_validate_range, *zip(*[(path, start, end) for start, end in ranges])))
+
+	bad = []
+	first_line = 0
+	for lines, problems in results:
+		bad.extend((first_line + line, offset, error, text) for line, offset, error, text in problems)
+		first_line += lines
+	return bad
+
+
+def repair_line(line):
+	"""
+	Salvages the records from a bad line: a byte-order mark or stray
+	whitespace is stripped, and several objects run together on one line are
+	split. Returns None if nothing valid can be recovered.
+	"""
+	text = line.decode("utf-8", "replace").strip().lstrip("\ufeff")
+	decoder = json.JSONDecoder()
+	records = []
+	position = 0
+	while position < len(text):
+		try:
+			record, position = decoder.raw_decode(text, position)
+		except ValueError:
+			return None
+		if not isinstance(record, dict):
+			return None
+		records.append(record)
+		while position < len(text) and text[position] in " \t,":
+			position += 1
+	return records or None
+
+
+def repair(path, quarantine_path=None, workers=None):
+	"""
+	Rewrites path with every bad line repaired where possible, and moved to
+	quarantine_path (default <path>.quarantine) otherwise. Returns
+	(repaired, quarantined) line counts.
+	"""
+	path = Path(path)
+	bad = {offset for _, offset, _, _ in validate(path, workers)}
+	if not bad:
+		return 0, 0
+
+	quarantine_path = Path(quarantine_path or str(path) + ".quarantine")
+	tmp_path = path.with_name(path.name + ".tmp")
+	repaired = quarantined = 0
+	with open(path, "rb") as src, open(tmp_path, "wb") as out, open(quarantine_path, "ab") as quarantine:
+		offset = 0
+		for line in src:
+			if offset in bad:
+				records = repair_line(line) if line.strip() else []
+				if records is None:
+					quarantine.write(line if line.endswith(b"\n") else line + b"\n")
+					quarantined += 1
+				else:
+					for record in records:
+						out.write(dumps(record) + b"\n")
+					repaired += 1
+			else:
+				out.write(line if line.endswith(b"\n") else line + b"\n")
+			offset += len(line)
+	tmp_path.replace(path)
+	return repaired, quarantined
+
+
+class Dataset:
+	"""
+	Random and filtered access to a JSONL file through its sidecar index,
+	which is built on first use, extended when lines have only been appended
+	and rebuilt when the file has otherwise changed.
+	"""
+
+	def __init__(self, path):
+		self.path = Path(path)
+		self.offsets_path = Path(str(self.path) + ".offsets")
+		self.index_path = Path(str(self.path) + ".idx")
+		self.offsets = array('q')
+		self.fields = {field: {} for field in INDEXED_FIELDS}
+		self.skipped = []
+		self.size = 0
+		self._load_or_build()
+
+	def _load_or_build(self):
+		stat = self.path.stat()
+		header = None
+		if self.index_path.exists() and self.offsets_path.exists():
+			with self.index_path.open() as fp:
+				header = json.load(fp)
+			if header.get("version") != INDEX_VERSION:
+				header = None
+
+		if header is not None and header["size"] <= stat.st_size:
+			with self.offsets_path.open("rb") as fp:
+				self.offsets.frombytes(fp.read())
+			self.fields = header["fields"]
+			self.skipped = header["skipped"]
+			self.size = header["size"]
+			if header["size"] == stat.st_size and header["mtime_ns"] == stat.st_mtime_ns:
+				return
+			if header["size"] < stat.st_size and self._ends_with_newline(self.size):
+				self._index_from(self.size)
+				self._save()
+				return
+
+		self.offsets = array('q')
+		self.fields = {field: {} for field in INDEXED_FIELDS}
+		self.skipped = []
+		self._index_from(0)
+		self._save()
+
+	def _ends_with_newline(self, size):
+		if size == 0:
+			return True
+		with self.path.open("rb") as fp:
+			fp.seek(size - 1)
+			return fp.read(1) == b"\n"
+
+	def _index_from(self, start):
+		with self.path.open("rb") as fp:
+			fp.seek(start)
+			offset = start
+			for line in fp:
+				if line.strip():
+					try:
+						record = loads(line)
+					except ValueError:
+						record = None
+					if not isinstance(record, dict):
+						self.skipped.append(offset)
+						offset += len(line)
+						continue
+					ix = len(self.offsets)
+					self.offsets.append(offset)
+					for field in INDEXED_FIELDS:
+						value = record.get(field)
+						if value is not None:
+							self.fields[field].setdefault(str(value), []).append(ix)
+				offset += len(line)
+			self.size = offset
+
+	def _save(self):
+		stat = self.path.stat()
+		with open(str(self.offsets_path) + ".tmp", "wb") as fp:
+			self.offsets.tofile(fp)
+		with open(str(self.index_path) + ".tmp", "w") as fp:
+			json.dump({"version": INDEX_VERSION, "size": self.size, "mtime_ns": stat.st_mtime_ns,
+					   "fields": self.fields, "skipped": self.skipped}, fp)
+		os.replace(str(self.offsets_path) + ".tmp", self.offsets_path)
+		os.replace(str(self.index_path) + ".tmp", self.index_path)
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def _read(self, fp, ix):
+		fp.seek(self.offsets[ix])
+		return loads(fp.readline())
+
+	def __getitem__(self, ix):
+		if ix < 0:
+			ix += len(self)
+		if not 0 <= ix < len(self):
+			raise IndexError(ix)
+		with self.path.open("rb") as fp:
+			return self._read(fp, ix)
+
+	def __iter__(self):
+		return self.records(range(len(self)))
+
+	def records(self, line_numbers):
+		with self.path.open("rb") as fp:
+			for ix in line_numbers:
+				yield self._read(fp, ix)
+
+	def lines(self, category=None, pdf_url=None):
+		"""
+		Line numbers of the records matching every given field, in file order.
+		"""
+		selected = None
+		for field, value in (("category", category), ("pdf_url", pdf_url)):
+			if value is None:
+				continue
+			matches = set(self.fields[field].get(value, ()))
+			selected = matches if selected is None else selected & matches
+		return range(len(self)) if selected is None else sorted(selected)
+
+	def where(self, category=None, pdf_url=None):
+		return self.records(self.lines(category, pdf_url))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("command", choices=("validate", "repair", "index", "select"))
+	parser.add_argument("path", nargs="?", default="questions.jsonl")
+	parser.add_argument("--workers", type=int, default=None)
+	parser.add_argument("--quarantine", default=None)
+	parser.add_argument("--category", default=None)
+	parser.add_argument("--pdf-url", default=None)
+	args = parser.parse_args()
+
+	if args.command == "validate":
+		bad = validate(args.path, args.workers)
+		for line, offset, error, text in bad:
+			print(f"line {line + 1} (byte {offset}): {error}: {text.rstrip()}")
+		print(f"{len(bad)} bad lines", file=sys.stderr)
+		sys.exit(1 if bad else 0)
+	elif args.command == "repair":
+		repaired, quarantined = repair(args.path, args.quarantine, args.workers)
+		print(f"{repaired} lines repaired, {quarantined} quarantined", file=sys.stderr)
+	elif args.command == "index":
+		dataset = Dataset(args.path)
+		print(f"{len(dataset)} records; " + ", ".join(f"{len(values)} distinct {field}" for field, values in dataset.fields.items()), file=sys.stderr)
+		if dataset.skipped:
+			print(f"{len(dataset.skipped)} bad lines skipped (run validate for details)", file=sys.stderr)
+	else:
+		for record in Dataset(args.path).where(args.category, args.pdf_url):
+			sys.stdout.write(json.dumps(record) + "\n")
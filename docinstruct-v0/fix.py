@@ -1,9 +1,15 @@
-from pathlib import Path
-import json
+from dataset import repair, validate
+import argparse
 
-with Path("questions.jsonl").open("r") as f:
-    for line in f:
-        try:
-            json.loads(line)
-        except:
-            print("Problem:", line)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report (and optionally repair) bad lines in a JSONL dataset.")
+    parser.add_argument("path", nargs="?", default="questions.jsonl")
+    parser.add_argument("--repair", action="store_true", help="Repair bad lines, quarantining what can't be saved.")
+    args = parser.parse_args()
+
+    for line, offset, error, text in validate(args.path):
+        print("Problem:", f"line {line + 1} (byte {offset}): {error}:", text.rstrip())
+
+    if args.repair:
+        repaired, quarantined = repair(args.path)
+        print(f"{repaired} lines repaired, {quarantined} quarantined")
@@ -1,21 +1,75 @@
 import spacy
+import argparse
 import json
+import sys
+import time
 
 from pathlib import Path
 
+from dataset import Dataset
 
-nlp = spacy.load("quality_model/model-last")
 
-if __name__ == '__main__':
-	input_path = Path("questions.jsonl")
-	
+def load_model(path="quality_model/model-last"):
+	return spacy.load(path)
+
 
-	with input_path.open() as fp:
+def read_questions(input_path, category=None, pdf_url=None):
+	# Filtered reads go through the dataset's line index and only decode
+	# the matching records.
+	if category is not None or pdf_url is not None:
+		yield from Dataset(input_path).where(category, pdf_url)
+		return
+	with Path(input_path).open() as fp:
 		for line in fp:
-			data = json.loads(line)
-			output = nlp(data['text'])
-			cat = max(output.cats.items(), key=lambda x: x[1])
-			data['question_quality'] = cat[0]
-			del data['html']
-			if cat[0] == 'GOOD':
-				print(json.dumps(data))
+			if line.strip():
+				yield json.loads(line)
+
+
+def label(cats, threshold=None):
+	# Without a threshold, keep the original behaviour: the top-scoring label.
+	if threshold is None:
+		return max(cats.items(), key=lambda x: x[1])[0]
+	return 'GOOD' if cats.get('GOOD', 0.0) >= threshold else 'BAD'
+
+
+def classify(nlp, questions, batch_size=256, n_process=1, threshold=None):
+	"""
+	Yields (question, label, GOOD score) for every question, in input order.
+	Texts are scored in batches with nlp.pipe, across n_process processes.
+	"""
+	pairs = ((data['text'], data) for data in questions)
+	for doc, data in nlp.pipe(pairs, as_tuples=True, batch_size=batch_size, n_process=n_process):
+		yield data, label(doc.cats, threshold), doc.cats.get('GOOD', 0.0)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Filter crowd-sourced questions with the quality model.")
+	parser.add_argument("--input", default="questions.jsonl")
+	parser.add_argument("--output", default=None, help="Defaults to stdout.")
+	parser.add_argument("--model", default="quality_model/model-last")
+	parser.add_argument("--batch-size", type=int, default=256)
+	parser.add_argument("--n-process", type=int, default=1)
+	parser.add_argument("--threshold", type=float, default=None,
+						help="Minimum GOOD score to keep a question; defaults to the top-scoring label.")
+	parser.add_argument("--all", action="store_true", help="Write BAD questions too.")
+	parser.add_argument("--category", default=None, help="Only classify questions in this category.")
+	parser.add_argument("--pdf-url", default=None, help="Only classify questions about this PDF.")
+	args = parser.parse_args()
+
+	nlp = load_model(args.model)
+	out = open(args.output, "w") if args.output else sys.stdout
+
+	start = time.perf_counter()
+	count = kept = 0
+	for data, quality, score in classify(nlp, read_questions(args.input, args.category, args.pdf_url), args.batch_size, args.n_process, args.threshold):
+		count += 1
+		data['question_quality'] = quality
+		data.pop('html', None)
+		if quality == 'GOOD' or args.all:
+			kept += 1
+			out.write(json.dumps(data) + "\n")
+
+	if out is not sys.stdout:
+		out.close()
+	elapsed = time.perf_counter() - start
+	print(f"{count} questions, {kept} written in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} docs/sec)", file=sys.stderr)
@@ -0,0 +1,213 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from pathlib import Path
+
+
+ANSWER_COLUMNS = ("Answer.question", "Answer.placeholder")
+
+
+def record_html(pdf_url, category, text):
+	# Same markup as csv_to_json.py.
+	return f'<p><b>{category}</b></p><iframe src="{pdf_url}" style="width: 100%; height: 400px"></iframe><br /><p>{text}</p>'
+
+
+class KeyIndex:
+	"""
+	Persistent (pdf_url, annotator, text) index for questions.jsonl, with the
+	next free id and the length of the JSONL as of the last committed ingest.
+	If the JSONL has any other length it was changed outside this index (by
+	hand, by fix.py, or by an ingest that was cut off), so the index is
+	rebuilt from it, after repair_last_line has dealt with a last line cut
+	off mid-write.
+	"""
+
+	def __init__(self, index_path, output_path):
+		self.output_path = Path(output_path)
+		self.db = sqlite3.connect(str(index_path))
+		self.db.execute("CREATE TABLE IF NOT EXISTS keys (pdf_url TEXT, annotator TEXT, text TEXT, "
+						"PRIMARY KEY (pdf_url, annotator, text)) WITHOUT ROWID")
+		self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+		self.db.commit()
+
+		size = self.output_path.stat().st_size if self.output_path.exists() else 0
+		committed = self._meta("jsonl_bytes")
+		if committed != size:
+			self.repair_last_line()
+			self.rebuild()
+
+	def _meta(self, name):
+		row = self.db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+		return row[0] if row else None
+
+	def _set_meta(self, name, value):
+		self.db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+	@property
+	def next_id(self):
+		return self._meta("next_id") or 0
+
+	def repair_last_line(self):
+		"""
+		Finishes or drops the JSONL's last line, and logs what was done: a
+		complete record missing its final newline gets one, and a line that
+		doesn't parse (an ingest cut off mid-write) is truncated away. Every
+		other line is left alone.
+		"""
+		if not self.output_path.exists():
+			return
+		with self.output_path.open("r+b") as fp:
+			size = fp.seek(0, os.SEEK_END)
+			start = size
+			tail = b""
+			while start > 0:
+				step = min(start, 1 << 16)
+				start -= step
+				fp.seek(start)
+				tail = fp.read(step) + tail
+				# The last line starts after the last newline but the final one.
+				newline = tail.rfind(b"\n", 0, len(tail) - 1)
+				if newline != -1:
+					start += newline + 1
+					tail = tail[newline + 1:]
+					break
+			if not tail.strip():
+				return
+			try:
+				json.loads(tail)
+			except ValueError:
+				fp.truncate(start)
+				print(f"{self.output_path}: dropped a torn last line at byte {start} ({len(tail)} bytes): "
+					  f"{tail[:200].decode('utf-8', 'replace')!r}", file=sys.stderr)
+				return
+			if not tail.endswith(b"\n"):
+				fp.write(b"\n")
+				print(f"{self.output_path}: added the missing newline after the last record", file=sys.stderr)
+
+	def rebuild(self):
+		"""
+		Re-reads the JSONL into the index. Lines that aren't records with a
+		pdf_url, annotator and text are skipped and reported, not fatal: run
+		fix.py to repair them.
+		"""
+		self.db.execute("DELETE FROM keys")
+		next_id = 0
+		skipped = []
+		if self.output_path.exists():
+			with self.output_path.open() as fp:
+				for number, line in enumerate(fp, 1):
+					if not line.strip():
+						continue
+					try:
+						data = json.loads(line)
+						self.add(data['pdf_url'], data['annotator'], data['text'])
+					except (ValueError, KeyError, TypeError, AttributeError) as e:
+						skipped.append((number, f"{type(e).__name__}: {e}"))
+						continue
+					try:
+						next_id = max(next_id, int(data['id']) + 1)
+					except (KeyError, TypeError, ValueError) as e:
+						skipped.append((number, f"no usable id ({type(e).__name__}: {e}); key indexed"))
+		for number, error in skipped[:20]:
+			print(f"{self.output_path}:{number}: {error}", file=sys.stderr)
+		if len(skipped) > 20:
+			print(f"{self.output_path}: ... {len(skipped) - 20} more", file=sys.stderr)
+		self._set_meta("next_id", next_id)
+		self._set_meta("jsonl_bytes", self.output_path.stat().st_size if self.output_path.exists() else 0)
+		self.db.commit()
+
+	def add(self, pdf_url, annotator, text):
+		"""
+		True if the key is new. Not committed until commit().
+		"""
+		cursor = self.db.execute("INSERT OR IGNORE INTO keys (pdf_url, annotator, text) VALUES (?, ?, ?)",
+								 (pdf_url, annotator, text.strip()))
+		return cursor.rowcount == 1
+
+	def commit(self, next_id, jsonl_bytes):
+		self._set_meta("next_id", next_id)
+		self._set_meta("jsonl_bytes", jsonl_bytes)
+		self.db.commit()
+
+	def rollback(self):
+		self.db.rollback()
+
+
+def read_batch(csv_path):
+	"""
+	Yields (pdf_url, category, annotator, text) per answered, non-rejected
+	assignment, one row at a time.
+	"""
+	with open(csv_path, newline='', encoding='utf-8', errors='replace') as fp:
+		reader = csv.DictReader(fp)
+		answer = next((column for column in ANSWER_COLUMNS if column in (reader.fieldnames or [])), None)
+		if answer is None:
+			raise ValueError(f"{csv_path} has none of the answer columns {ANSWER_COLUMNS}")
+		for row in reader:
+			if row.get('AssignmentStatus') == 'Rejected':
+				continue
+			text = row[answer]
+			if text and text.strip():
+				yield row['Input.pdf_url'], row['Input.Category'], row['WorkerId'], text
+
+
+def ingest(csv_paths, output_path="questions.jsonl", index_path="questions.index.sqlite"):
+	"""
+	Appends the new questions from each batch CSV to output_path. Each CSV is
+	committed to the index once its records are flushed to disk.
+	"""
+	index = KeyIndex(index_path, output_path)
+	next_id = index.next_id
+	totals = {}
+
+	with open(output_path, "a") as out:
+		for csv_path in csv_paths:
+			start = time.perf_counter()
+			rows = added = 0
+			first_id = next_id
+			try:
+				for pdf_url, category, annotator, text in read_batch(csv_path):
+					rows += 1
+					if not index.add(pdf_url, annotator, text):
+						continue
+					out.write(json.dumps({
+						'html': record_html(pdf_url, category, text),
+						'text': text,
+						'category': category,
+						'pdf_url': pdf_url,
+						'annotator': annotator,
+						'id': next_id
+					}) + "\n")
+					next_id += 1
+					added += 1
+				out.flush()
+				os.fsync(out.fileno())
+			except Exception:
+				index.rollback()
+				raise
+			index.commit(next_id, out.tell())
+
+			totals[str(csv_path)] = {'rows': rows, 'added': added, 'ids': [first_id, next_id - 1] if added else None}
+			print(f"{csv_path}: {rows} rows, {added} new, {rows - added} duplicates "
+				  f"in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+	return totals
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Append new MTurk batch results to questions.jsonl.")
+	parser.add_argument("csv_paths", nargs="*", type=Path,
+						help="Batch result CSVs; defaults to ../Batch_*_batch_results.csv.")
+	parser.add_argument("--output", default="questions.jsonl")
+	parser.add_argument("--index", default="questions.index.sqlite")
+	parser.add_argument("--rebuild-index", action="store_true", help="Re-read the JSONL into the key index first.")
+	args = parser.parse_args()
+
+	csv_paths = args.csv_paths or sorted(Path("..").glob("Batch_*_batch_results.csv"))
+	if args.rebuild_index:
+		KeyIndex(args.index, args.output).rebuild()
+	ingest(csv_paths, args.output, args.index)
@@ -0,0 +1,173 @@
+import argparse
+import json
+import queue
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from inference import label, load_model
+
+
+class MicroBatcher:
+	"""
+	Coalesces concurrent score() calls into nlp.pipe batches. A batch is run
+	as soon as it holds max_batch texts, or max_wait seconds after its first
+	text arrived, whichever comes first.
+	"""
+
+	def __init__(self, nlp, max_batch=64, max_wait=0.005):
+		self.nlp = nlp
+		self.max_batch = max_batch
+		self.max_wait = max_wait
+		self.queue = queue.Queue()
+
+		self.lock = threading.Lock()
+		self.started = time.time()
+		self.requests = 0
+		self.batches = 0
+		self.batch_sizes = {}
+		self.latencies = []
+
+		threading.Thread(target=self._run, daemon=True).start()
+
+	def score(self, texts):
+		"""
+		Category scores for each text, in order.
+		"""
+		start = time.perf_counter()
+		pending = [(text, threading.Event(), {}) for text in texts]
+		for item in pending:
+			self.queue.put(item)
+		for _, done, result in pending:
+			done.wait()
+
+		elapsed = time.perf_counter() - start
+		with self.lock:
+			self.requests += len(texts)
+			self.latencies.append(elapsed)
+			# Keep a bounded window for the percentiles.
+			if len(self.latencies) > 10000:
+				del self.latencies[:5000]
+
+		results = [result for _, _, result in pending]
+		for result in results:
+			if 'error' in result:
+				raise RuntimeError(result['error'])
+		return [result['cats'] for result in results]
+
+	def _run(self):
+		while True:
+			batch = [self.queue.get()]
+			deadline = time.perf_counter() + self.max_wait
+			while len(batch) < self.max_batch:
+				remaining = deadline - time.perf_counter()
+				if remaining <= 0:
+					break
+				try:
+					batch.append(self.queue.get(timeout=remaining))
+				except queue.Empty:
+					break
+
+			try:
+				docs = self.nlp.pipe([text for text, _, _ in batch], batch_size=len(batch))
+				for (_, _, result), doc in zip(batch, docs):
+					result['cats'] = dict(doc.cats)
+			except Exception as e:
+				for _, _, result in batch:
+					result['error'] = f"{type(e).__name__}: {e}"
+
+			with self.lock:
+				self.batches += 1
+				self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+			for _, done, _ in batch:
+				done.set()
+
+	def metrics(self):
+		with self.lock:
+			latencies = sorted(self.latencies)
+			uptime = time.time() - self.started
+
+			def percentile(p):
+				return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else None
+
+			return {
+				'requests': self.requests,
+				'batches': self.batches,
+				'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+				'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+				'docs_per_sec': self.requests / uptime if uptime else 0.0,
+				'latency_ms_p50': percentile(0.5),
+				'latency_ms_p99': percentile(0.99),
+				'uptime_seconds': uptime,
+			}
+
+
+class QualityServer(ThreadingHTTPServer):
+	daemon_threads = True
+	# The default backlog of 5 drops connections under concurrent clients.
+	request_queue_size = 1024
+
+
+def make_handler(batcher, threshold=None):
+
+	class Handler(BaseHTTPRequestHandler):
+
+		def log_message(self, format, *args):
+			pass
+
+		def _reply(self, status, body):
+			payload = json.dumps(body).encode("utf-8")
+			self.send_response(status)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(payload)))
+			self.end_headers()
+			self.wfile.write(payload)
+
+		def do_GET(self):
+			if self.path == "/metrics":
+				self._reply(200, batcher.metrics())
+			elif self.path == "/health":
+				self._reply(200, {'status': 'ok'})
+			else:
+				self._reply(404, {'error': f"Unknown path {self.path}"})
+
+		def do_POST(self):
+			if self.path != "/score":
+				self._reply(404, {'error': f"Unknown path {self.path}"})
+				return
+			try:
+				request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+				texts = request['texts'] if 'texts' in request else [request['text']]
+				if not all(isinstance(text, str) for text in texts):
+					raise ValueError("texts must be strings")
+			except (KeyError, TypeError, ValueError) as e:
+				self._reply(400, {'error': f"Expected {{\"text\": ...}} or {{\"texts\": [...]}}: {e}"})
+				return
+
+			try:
+				scores = batcher.score(texts)
+			except RuntimeError as e:
+				self._reply(500, {'error': str(e)})
+				return
+
+			results = [{'cats': cats, 'question_quality': label(cats, threshold)} for cats in scores]
+			self._reply(200, results[0] if 'text' in request and 'texts' not in request else {'results': results})
+
+	return Handler
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Serve the question-quality model over HTTP.")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8090)
+	parser.add_argument("--model", default="quality_model/model-last")
+	parser.add_argument("--max-batch", type=int, default=64)
+	parser.add_argument("--max-wait-ms", type=float, default=5.0)
+	parser.add_argument("--threshold", type=float, default=None)
+	args = parser.parse_args()
+
+	batcher = MicroBatcher(load_model(args.model), args.max_batch, args.max_wait_ms / 1000)
+	server = QualityServer((args.host, args.port), make_handler(batcher, args.threshold))
+	print(f"Quality model on http://{args.host}:{args.port}/score (metrics at /metrics)")
+	server.serve_forever()
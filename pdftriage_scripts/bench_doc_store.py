@@ -0,0 +1,103 @@
+"""
+Load time and memory of a document's metadata as -metadata.json (json.load)
+versus -metadata.bin (lazy, memory-mapped), each answering one page fetch.
+
+Each run happens in a fresh interpreter so ru_maxrss reflects only that run.
+
+    python bench_doc_store.py measure --metadata data/valid_metadata/DR--1058108-metadata.json
+    python bench_doc_store.py measure --pages 5000
+"""
+from __future__ import annotations
+from pathlib import Path
+
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from bench_extract_memory import peak_rss_mb
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.argument("path", type=Path)
+@click.option("--page", default="1")
+def child(
+        path: Path,
+        page: str,
+):
+    import functions
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    tree = functions.load_tree(path)
+    loaded = time.perf_counter() - start
+    text = functions.fetch_pages(tree, [page])
+    print(json.dumps({
+        "load_seconds": loaded,
+        "first_fetch_seconds": time.perf_counter() - start,
+        "chars": len(text),
+        "rss_delta_mb": peak_rss_mb() - baseline,
+    }))
+
+
+@cli.command()
+@click.option("--metadata", "metadata_path", type=Path, default=None, help="Existing -metadata.json to measure.")
+@click.option("--pages", type=int, default=5000, help="Pages in the synthetic document if --metadata is not given.")
+@click.option("--repeat", type=int, default=3)
+def measure(
+        metadata_path: Path | None,
+        pages: int,
+        repeat: int,
+):
+    from doc_store import write_document
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if metadata_path is None:
+            from extract_metadata import extract_metadata
+            from synthetic_extract import write_synthetic_extract
+            extract_path = write_synthetic_extract(tmp / "synthetic.json", pages, elements_per_page=40)
+            metadata = extract_metadata(extract_path, stream=True)
+        else:
+            with open(metadata_path) as f:
+                metadata = json.load(f)
+
+        json_path = tmp / "document-metadata.json"
+        with open(json_path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        binary_path = tmp / "document-metadata.bin"
+        write_document(binary_path, metadata)
+        page = next(iter(metadata['pages']))
+
+        print(f"-metadata.json {json_path.stat().st_size / 1024 ** 2:.1f} MB, "
+              f"-metadata.bin {binary_path.stat().st_size / 1024 ** 2:.1f} MB")
+        # load_tree prefers the .bin when it is present, so time the JSON path
+        # from a directory that only has the JSON.
+        json_only = tmp / "json-only"
+        json_only.mkdir()
+        (json_only / json_path.name).write_bytes(json_path.read_bytes())
+
+        for label, path in [("json", json_only / json_path.name), ("binary", binary_path)]:
+            runs = []
+            for _ in range(repeat):
+                result = subprocess.run(
+                    [sys.executable, __file__, "child", str(path), "--page", str(page)],
+                    check=True, capture_output=True, text=True,
+                )
+                runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+            best = min(runs, key=lambda run: run["first_fetch_seconds"])
+            print(f"{label:>8}: load {best['load_seconds'] * 1e3:.1f} ms, "
+                  f"load + first fetch {best['first_fetch_seconds'] * 1e3:.1f} ms, "
+                  f"RSS +{best['rss_delta_mb']:.1f} MB")
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,76 @@
+"""
+Embedding throughput (texts/sec) against the local stub server: a single
+request per call, as embed() used to send, versus token-bounded batches sent
+concurrently by embedding_batcher.
+
+    python bench_embed_batching.py --texts 500 --texts 5000 --workers 1 --workers 4 --workers 8
+
+The stub is started in-process and charges --latency per request plus
+--text-latency per text. A single request over 2048 inputs is rejected by
+the stub, as by the real endpoint, and is reported as failed.
+"""
+from __future__ import annotations
+
+import time
+
+import click
+import numpy
+import openai
+
+from embedding_batcher import embed_batched
+from stub_openai_server import start_stub_server
+from synthetic_extract import WORDS
+
+
+def synthetic_texts(
+        count: int,
+        words: int,
+        seed: int = 0,
+) -> list[str]:
+    rng = numpy.random.default_rng(seed)
+    return [" ".join(rng.choice(WORDS, size=words)) for _ in range(count)]
+
+
+@click.command()
+@click.option("--texts", "text_counts", type=int, multiple=True, default=[500, 5_000])
+@click.option("--words", type=int, default=300, show_default=True, help="Words per text (about a page).")
+@click.option("--workers", "worker_counts", type=int, multiple=True, default=[1, 4, 8])
+@click.option("--batch-tokens", type=int, default=100_000, show_default=True)
+@click.option("--latency", type=float, default=0.2, show_default=True)
+@click.option("--text-latency", type=float, default=0.001, show_default=True)
+def main(
+        text_counts: list[int],
+        words: int,
+        worker_counts: list[int],
+        batch_tokens: int,
+        latency: float,
+        text_latency: float,
+):
+    server, api_base = start_stub_server(latency=latency, dim=256, text_latency=text_latency)
+    openai.api_base = api_base
+    openai.api_key = openai.api_key or "stub"
+
+    print(f"{'texts':>7} {'mode':>22} {'seconds':>8} {'texts/sec':>10}")
+    for count in text_counts:
+        texts = synthetic_texts(count, words)
+
+        start = time.perf_counter()
+        try:
+            openai.Embedding.create(input=texts, model="text-embedding-ada-002")
+            seconds = time.perf_counter() - start
+            print(f"{count:>7} {'single request':>22} {seconds:>8.2f} {count / seconds:>10.0f}")
+        except openai.error.OpenAIError as e:
+            print(f"{count:>7} {'single request':>22}   failed: {e}")
+
+        for workers in worker_counts:
+            start = time.perf_counter()
+            embeddings = embed_batched(texts, workers=workers, max_batch_tokens=batch_tokens)
+            seconds = time.perf_counter() - start
+            assert len(embeddings) == count
+            print(f"{count:>7} {f'batched, {workers} workers':>22} {seconds:>8.2f} {count / seconds:>10.0f}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Embedding throughput (texts/sec) of each embedding backend on this machine.
+
+    python bench_embedding_backends.py --backend hashing --texts 10000
+    python bench_embedding_backends.py --backend openai --api-base http://127.0.0.1:8089/v1   # stub_openai_server.py
+
+The openai backend goes through the embedding cache, which is replaced by an
+empty in-memory one so every text is actually embedded.
+"""
+from __future__ import annotations
+
+import time
+
+import click
+import openai
+
+from bench_embed_batching import synthetic_texts
+from embedding_backends import EMBEDDING_BACKENDS, make_embedding_backend
+from embedding_cache import EmbeddingCache, set_embedding_cache
+
+
+@click.command()
+@click.option("--backend", "backends", type=click.Choice(sorted(EMBEDDING_BACKENDS)), multiple=True,
+              default=["hashing"], show_default=True)
+@click.option("--texts", "text_count", type=int, default=10_000, show_default=True)
+@click.option("--words", type=int, default=300, show_default=True, help="Words per text (about a page).")
+@click.option("--batch", type=int, default=256, show_default=True, help="Texts per embed() call.")
+@click.option("--api-base", default=None)
+def main(
+        backends: list[str],
+        text_count: int,
+        words: int,
+        batch: int,
+        api_base: str | None,
+):
+    if api_base:
+        openai.api_base = api_base
+        openai.api_key = openai.api_key or "stub"
+
+    texts = synthetic_texts(text_count, words)
+    print(f"{'backend':>10} {'dim':>6} {'seconds':>8} {'texts/sec':>10}")
+    for name in backends:
+        set_embedding_cache(EmbeddingCache(path=None))
+        backend = make_embedding_backend(name)
+
+        start = time.perf_counter()
+        dim = 0
+        for offset in range(0, len(texts), batch):
+            dim = backend.embed(texts[offset:offset + batch]).shape[1]
+        seconds = time.perf_counter() - start
+        print(f"{name:>10} {dim:>6} {seconds:>8.2f} {len(texts) / seconds:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
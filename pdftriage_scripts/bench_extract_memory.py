@@ -0,0 +1,108 @@
+"""
+Peak RSS of extract_metadata() with and without streaming.
+
+Each mode runs in a fresh interpreter so ru_maxrss only reflects that run.
+The two -metadata.json outputs are compared byte for byte, and the run fails
+if the streaming mode goes over --max-rss-mb.
+
+    python bench_extract_memory.py measure --pages 2000
+    python bench_extract_memory.py measure --extract data/valid_json/DR--1058108.json
+"""
+from __future__ import annotations
+from pathlib import Path
+
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss survives execve on Linux, so a child would report its
+    # parent's peak; VmHWM belongs to the new address space.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return rss / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.argument("extract_path", type=Path)
+@click.argument("output_path", type=Path)
+@click.option("--stream/--no-stream", default=False)
+def child(
+        extract_path: Path,
+        output_path: Path,
+        stream: bool,
+):
+    from extract_metadata import extract_metadata
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    metadata = extract_metadata(extract_path, stream=stream)
+    with open(output_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    print(json.dumps({
+        "seconds": time.perf_counter() - start,
+        "baseline_rss_mb": baseline,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+@cli.command()
+@click.option("--extract", "extract_path", type=Path, default=None, help="Existing Extract JSON to measure.")
+@click.option("--pages", type=int, default=2000, help="Pages in the synthetic document if --extract is not given.")
+@click.option("--elements-per-page", type=int, default=40)
+@click.option("--max-rss-mb", type=float, default=None, help="Fail if streaming peak RSS exceeds this.")
+def measure(
+        extract_path: Path | None,
+        pages: int,
+        elements_per_page: int,
+        max_rss_mb: float | None,
+):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if extract_path is None:
+            from synthetic_extract import write_synthetic_extract
+            extract_path = write_synthetic_extract(tmp / "synthetic.json", pages, elements_per_page=elements_per_page)
+        print(f"{extract_path}: {extract_path.stat().st_size / 1024 ** 2:.1f} MB")
+
+        outputs = {}
+        for mode in ["--no-stream", "--stream"]:
+            output_path = tmp / f"metadata{mode}.json"
+            result = subprocess.run(
+                [sys.executable, __file__, "child", str(extract_path), str(output_path), mode],
+                check=True, capture_output=True, text=True,
+            )
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            outputs[mode] = (output_path.read_bytes(), stats)
+            print(f"{mode:>12}: {stats['seconds']:.2f}s, peak RSS {stats['peak_rss_mb']:.1f} MB "
+                  f"(interpreter baseline {stats['baseline_rss_mb']:.1f} MB)")
+
+        identical = outputs["--no-stream"][0] == outputs["--stream"][0]
+        print(f"byte-identical output: {identical}")
+        if not identical:
+            raise SystemExit(1)
+        streaming_peak = outputs["--stream"][1]["peak_rss_mb"]
+        if max_rss_mb is not None and streaming_peak > max_rss_mb:
+            print(f"streaming peak RSS {streaming_peak:.1f} MB exceeds ceiling of {max_rss_mb:.1f} MB")
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,69 @@
+"""
+Scaling of extract_to_tree_v4 on synthetic Extract documents.
+
+Sections default to spanning ~100 pages each, which is where the old
+string-concatenating builder went quadratic. The fitted log-log slope of
+time against page count should stay close to 1.
+
+    python bench_extract_scaling.py --pages 10 --pages 100 --pages 1000 --pages 10000
+"""
+from __future__ import annotations
+
+import math
+import time
+
+import click
+
+from extract_metadata import extract_to_tree_v4
+from synthetic_extract import synthetic_extract
+
+
+def best_of(
+        fn,
+        repeat: int,
+) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def loglog_slope(
+        xs: list[float],
+        ys: list[float],
+) -> float:
+    lx = [math.log(x) for x in xs]
+    ly = [math.log(y) for y in ys]
+    mx, my = sum(lx) / len(lx), sum(ly) / len(ly)
+    return sum((x - mx) * (y - my) for x, y in zip(lx, ly)) / sum((x - mx) ** 2 for x in lx)
+
+
+@click.command()
+@click.option("--pages", "page_counts", type=int, multiple=True, default=[10, 100, 1_000, 10_000])
+@click.option("--elements-per-page", type=int, default=40)
+@click.option("--sections-per-page", type=float, default=0.01)
+@click.option("--repeat", type=int, default=3)
+def main(
+        page_counts: list[int],
+        elements_per_page: int,
+        sections_per_page: float,
+        repeat: int,
+):
+    timings = []
+    print(f"{'pages':>8} {'elements':>10} {'total (ms)':>12} {'per page (us)':>14}")
+    for pages in page_counts:
+        elements = synthetic_extract(
+            pages, elements_per_page=elements_per_page, sections_per_page=sections_per_page
+        )['elements']
+        seconds = best_of(lambda: extract_to_tree_v4(elements), repeat)
+        timings.append(seconds)
+        print(f"{pages:>8} {len(elements):>10} {seconds * 1e3:>12.2f} {seconds / pages * 1e6:>14.1f}")
+
+    if len(page_counts) > 1:
+        print(f"log-log slope: {loglog_slope(page_counts, timings):.2f} (1.0 is linear)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Retrieval latency and page recall for each search backend, over the
+documents referenced by a questions file.
+
+Recall@k is measured on the questions that name the pages they are about:
+a `pages` list on the record if there is one, otherwise the pages mentioned
+in the text ("What buttons are listed on page 2?", "pages 1 and 3"). It is
+the fraction of those pages among the k retrieved.
+
+    python bench_hybrid_retrieval.py --questions ../docinstruct-v0/question_filtered.jsonl
+    python bench_hybrid_retrieval.py --api-base http://127.0.0.1:8089/v1   # stub_openai_server.py
+    python bench_hybrid_retrieval.py --embedding-backend hashing          # no network
+
+Questions whose -metadata.json isn't under --metadata-dir are skipped.
+"""
+from __future__ import annotations
+from pathlib import Path
+
+import json
+import re
+import statistics
+import time
+
+import click
+import openai
+
+from embedding_backends import EMBEDDING_BACKENDS, make_embedding_backend, set_embedding_backend
+from functions import derived, load_tree, retrieve
+from lexical_index import BM25Index
+
+
+BACKENDS = ("embedding", "bm25", "hybrid")
+PAGE_MENTION = re.compile(r"\bpages? (\d+)(?:(?:\s*,\s*|\s*-\s*|\s+to\s+|,?\s+and\s+)(\d+))?", re.IGNORECASE)
+
+
+def labelled_pages(
+        question: dict
+) -> set[str]:
+    if question.get('pages'):
+        return {str(page) for page in question['pages']}
+    pages = set()
+    for match in PAGE_MENTION.finditer(question['text']):
+        first, second = match.group(1), match.group(2)
+        if second and re.search(r"-|to", match.group(0)):
+            pages.update(str(page) for page in range(int(first), int(second) + 1))
+        else:
+            pages.update(page for page in (first, second) if page)
+    return pages
+
+
+@click.command()
+@click.option("--questions", "questions_path", type=Path, default="data/question_filtered.jsonl", show_default=True)
+@click.option("--metadata-dir", type=Path, default="data/valid_metadata", show_default=True)
+@click.option("--limit", type=int, default=None)
+@click.option("--k", type=int, default=4, show_default=True)
+@click.option("--backend", "backends", type=click.Choice(BACKENDS), multiple=True, default=BACKENDS)
+@click.option("--api-base", default=None)
+@click.option("--embedding-backend", type=click.Choice(sorted(EMBEDDING_BACKENDS)), default=None)
+def main(
+        questions_path: Path,
+        metadata_dir: Path,
+        limit: int | None,
+        k: int,
+        backends: list[str],
+        api_base: str | None,
+        embedding_backend: str | None,
+):
+    if api_base:
+        openai.api_base = api_base
+        openai.api_key = openai.api_key or "stub"
+    if embedding_backend:
+        set_embedding_backend(make_embedding_backend(embedding_backend))
+
+    stats = {backend: {"seconds": [], "recall": []} for backend in backends}
+    agreement = []
+    evaluated = skipped = 0
+    with open(questions_path) as f:
+        for line in f:
+            if limit is not None and evaluated >= limit:
+                break
+            question = json.loads(line)
+            tree_path = metadata_dir / question['pdf_url'].split("/")[-1].replace(".pdf", "-metadata.json")
+            if not tree_path.exists():
+                skipped += 1
+                continue
+
+            tree = load_tree(tree_path)
+            page_ids = [page for page, text in tree['pages'].items() if text.strip()]
+            texts = [tree['pages'][page] for page in page_ids]
+            lexical_index = derived(tree, "bm25", lambda t: BM25Index.build(t['pages']))
+
+            # Only pages the document has can be retrieved.
+            expected = labelled_pages(question) & {str(page) for page in page_ids}
+            fetched = {}
+            for backend in backends:
+                start = time.perf_counter()
+                hits = retrieve(question['text'], page_ids, texts, k, backend,
+                                lexical_index if backend != "embedding" else None)
+                stats[backend]["seconds"].append(time.perf_counter() - start)
+                fetched[backend] = {hit["id"] for hit in hits}
+                if expected:
+                    found = {str(page) for page in fetched[backend]} & expected
+                    stats[backend]["recall"].append(len(found) / len(expected))
+
+            if "hybrid" in fetched and "embedding" in fetched:
+                agreement.append(len(fetched["hybrid"] & fetched["embedding"]) / max(1, len(fetched["hybrid"])))
+            evaluated += 1
+
+    print(f"{evaluated} questions evaluated, {skipped} skipped (no metadata)")
+    if not evaluated:
+        return
+    labelled = len(next(iter(stats.values()))["recall"])
+    print(f"{labelled} of them name the pages they are about")
+    print(f"{'backend':>10} {'mean (ms)':>10} {'p95 (ms)':>10} {f'recall@{k}':>10}")
+    for backend, values in stats.items():
+        seconds = sorted(values["seconds"])
+        p95 = seconds[max(0, int(len(seconds) * 0.95) - 1)]
+        recall = f"{statistics.mean(values['recall']):.2f}" if values["recall"] else "-"
+        print(f"{backend:>10} {statistics.mean(seconds) * 1e3:>10.2f} {p95 * 1e3:>10.2f} {recall:>10}")
+    if agreement:
+        print(f"hybrid pages also returned by embedding search: {statistics.mean(agreement):.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Build time, size and query latency of the BM25 page index on a synthetic
+document.
+
+    python bench_lexical_index.py --pages 1000
+"""
+from __future__ import annotations
+from pathlib import Path
+
+import random
+import statistics
+import tempfile
+import time
+
+import click
+
+from extract_metadata import extract_to_tree_v4
+from lexical_index import BM25Index
+from synthetic_extract import WORDS, synthetic_extract
+
+
+@click.command()
+@click.option("--pages", type=int, default=1000)
+@click.option("--elements-per-page", type=int, default=20)
+@click.option("--queries", "query_count", type=int, default=1000)
+@click.option("--seed", type=int, default=0)
+def main(
+        pages: int,
+        elements_per_page: int,
+        query_count: int,
+        seed: int,
+):
+    elements = synthetic_extract(pages, elements_per_page=elements_per_page, seed=seed)['elements']
+    _, page_to_text, _, _ = extract_to_tree_v4(elements)
+
+    start = time.perf_counter()
+    index = BM25Index.build(page_to_text)
+    build = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "index.bm25.json"
+        index.save(path)
+        size = path.stat().st_size
+        start = time.perf_counter()
+        BM25Index.load(path)
+        load = time.perf_counter() - start
+
+    rng = random.Random(seed)
+    queries = []
+    for i in range(query_count):
+        words = rng.sample(WORDS, rng.randint(1, 4))
+        queries.append(f'"{words[0]} {words[1]}"' if i % 4 == 0 and len(words) > 1 else " ".join(words))
+
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, k=4)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    print(f"{pages} pages, {len(index.postings)} terms")
+    print(f"build {build * 1e3:.1f} ms, serialized {size / 1024 ** 2:.1f} MB, load {load * 1e3:.1f} ms")
+    print(f"query p50 {statistics.median(timings) * 1e3:.3f} ms, "
+          f"p99 {timings[int(len(timings) * 0.99) - 1] * 1e3:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
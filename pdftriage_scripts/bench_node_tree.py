@@ -0,0 +1,50 @@
+"""
+Build time, memory and full-walk time of the Node trees built by
+extract_to_tree and extract_to_tree_v3 on synthetic Extract documents.
+
+    python bench_node_tree.py --pages 100 --pages 1000 --depth 3
+"""
+from __future__ import annotations
+
+import time
+import tracemalloc
+
+import click
+
+from extract_metadata import extract_to_tree, extract_to_tree_v3
+from synthetic_extract import synthetic_extract
+
+
+@click.command()
+@click.option("--pages", "page_counts", type=int, multiple=True, default=[100, 1_000])
+@click.option("--elements-per-page", type=int, default=20)
+@click.option("--depth", type=int, default=3)
+def main(
+        page_counts: list[int],
+        elements_per_page: int,
+        depth: int,
+):
+    print(f"{'builder':>20} {'pages':>7} {'build (ms)':>11} {'tree (MB)':>10} {'walk (ms)':>10}")
+    for pages in page_counts:
+        elements = synthetic_extract(pages, elements_per_page=elements_per_page, depth=depth)['elements']
+        for builder in [extract_to_tree, extract_to_tree_v3]:
+            start = time.perf_counter()
+            root = builder(elements)
+            build = time.perf_counter() - start
+            del root
+
+            tracemalloc.start()
+            root = builder(elements)
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            root.sections
+            root.title
+            walk = time.perf_counter() - start
+
+            print(f"{builder.__name__:>20} {pages:>7} {build * 1e3:>11.1f} {size / 1024 ** 2:>10.1f} {walk * 1e3:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
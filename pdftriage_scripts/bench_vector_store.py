@@ -0,0 +1,64 @@
+"""
+Latency of VectorStore.neighbors / neighbors_batch at increasing store sizes.
+
+    python bench_vector_store.py --rows 1000 --rows 100000 --rows 1000000
+
+ada-002 embeddings have 1536 dimensions; a million float32 rows at that width
+is ~6 GB, so pass a smaller --dim on machines without that much memory.
+"""
+from __future__ import annotations
+
+import time
+
+import click
+import numpy
+
+from functions import VectorStore
+
+
+def time_call(
+        fn,
+        repeat: int,
+) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(numpy.median(timings))
+
+
+@click.command()
+@click.option("--rows", "row_counts", type=int, multiple=True, default=[1_000, 100_000, 1_000_000])
+@click.option("--dim", type=int, default=1536)
+@click.option("--k", type=int, default=4)
+@click.option("--batch", type=int, default=64, help="Queries per neighbors_batch call.")
+@click.option("--repeat", type=int, default=5)
+@click.option("--seed", type=int, default=0)
+def main(
+        row_counts: list[int],
+        dim: int,
+        k: int,
+        batch: int,
+        repeat: int,
+        seed: int,
+):
+    rng = numpy.random.default_rng(seed)
+    print(f"{'rows':>10} {'build (ms)':>12} {'single (ms)':>12} {'batch/query (ms)':>18}")
+    for rows in row_counts:
+        vectors = rng.standard_normal((rows, dim), dtype=numpy.float32)
+        queries = rng.standard_normal((batch, dim), dtype=numpy.float32)
+
+        start = time.perf_counter()
+        store = VectorStore(vectors)
+        build = time.perf_counter() - start
+        del vectors
+
+        single = time_call(lambda: store.neighbors(queries[0], k), repeat)
+        batched = time_call(lambda: store.neighbors_batch(queries, k), repeat) / batch
+
+        print(f"{rows:>10} {build * 1e3:>12.2f} {single * 1e3:>12.3f} {batched * 1e3:>18.3f}")
+
+
+if __name__ == '__main__':
+    main()
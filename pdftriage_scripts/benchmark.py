@@ -0,0 +1,315 @@
+"""
+Micro-benchmarks for the extraction and retrieval hot paths.
+
+Every case runs offline on a synthetic Extract document of configurable
+scale. openai.Embedding.create and openai.ChatCompletion.create are
+replaced by local stubs for the run, so no API calls are made, and tokens
+are counted as regex words, so tiktoken's encodings aren't downloaded. Each case
+records its median and best wall time over --repeat runs and its peak
+traced memory (tracemalloc, in a separate run so tracing doesn't skew the
+timings). Results are written as JSON. With --baseline they are compared
+against an earlier results file, and the exit status is 1 if any case got
+slower or bigger by more than the tolerances.
+
+    python benchmark.py --pages 200 --output bench.json
+    python benchmark.py --pages 200 --baseline bench.json
+    python benchmark.py --case fetch_pages --case vector_store.neighbors
+
+A case that fails is reported and left out of the comparison.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import gc
+import json
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+import numpy
+import openai
+
+from completion_cache import CompletionCache, set_completion_cache
+from embedding_backends import OpenAIEmbeddingBackend, set_embedding_backend
+from embedding_cache import EmbeddingCache, set_embedding_cache
+from extract_metadata import extract_to_tree, extract_to_tree_v3, extract_to_tree_v4
+from lexical_index import BM25Index
+from metadata_packing import set_tokenizer
+from stub_openai_server import stub_embedding
+from synthetic_extract import synthetic_extract
+
+import chunking
+import functions
+
+
+RESULTS_VERSION = 1
+
+
+@dataclass
+class Fixture:
+    elements: list[dict]
+    tree: dict
+    pages_text: str
+    vectors: numpy.ndarray
+    queries: numpy.ndarray
+    rng: random.Random
+    extract_path: Path
+    tree_path: Path
+
+
+def build_fixture(
+        pages: int,
+        elements_per_page: int,
+        depth: int,
+        vectors: int,
+        dim: int,
+        seed: int,
+        directory: Path,
+) -> Fixture:
+    """
+    Also writes the extract and metadata to `directory`, for the entry points
+    that take file paths.
+    """
+    extract = synthetic_extract(pages, elements_per_page=elements_per_page, depth=depth, seed=seed)
+    elements = extract['elements']
+
+    # Shaped like a tree written by extract_metadata and read back by load_tree.
+    tree, page_to_text, _, _ = extract_to_tree_v4(elements)
+    metadata = {
+        "pages": page_to_text,
+        "sections": [
+            {"title": section['title'], "pages": section['pages'], "text": section['text']}
+            for section in tree.values()
+        ],
+    }
+    extract_path = directory / "synthetic.json"
+    tree_path = directory / "synthetic-metadata.json"
+    with extract_path.open("w") as f:
+        json.dump(extract, f)
+    with tree_path.open("w") as f:
+        json.dump(metadata, f)
+    metadata = functions.load_tree(tree_path)
+
+    rng = numpy.random.default_rng(seed)
+    return Fixture(
+        elements=elements,
+        tree=metadata,
+        pages_text=" ".join(metadata['pages'].values()),
+        vectors=rng.standard_normal((vectors, dim), dtype=numpy.float32),
+        queries=rng.standard_normal((64, dim), dtype=numpy.float32),
+        rng=random.Random(seed),
+        extract_path=extract_path,
+        tree_path=tree_path,
+    )
+
+
+def _stub_embedding_create(input, model, **kwargs):
+    texts = [input] if isinstance(input, str) else input
+    return {"data": [{"index": i, "embedding": stub_embedding(text, 256)} for i, text in enumerate(texts)]}
+
+
+def _stub_chat_create(**request):
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": "Stub answer."},
+                         "finish_reason": "stop"}]}
+
+
+def install_stubs() -> None:
+    openai.Embedding.create = _stub_embedding_create
+    openai.ChatCompletion.create = _stub_chat_create
+    set_embedding_cache(EmbeddingCache(path=None))
+    set_embedding_backend(OpenAIEmbeddingBackend())
+    set_completion_cache(CompletionCache(mode="passthrough"))
+    set_tokenizer("words")
+
+
+def cases(
+        fixture: Fixture
+) -> dict[str, Callable[[], object]]:
+    """
+    name -> zero-argument callable. Per-document indexes (derived) are warm
+    after the first run, so the steady-state cost is what gets timed.
+    """
+    tree = fixture.tree
+    page_numbers = [int(page) for page in tree['pages']]
+    titles = [section['title'] for section in tree['sections']]
+    store = functions.VectorStore(fixture.vectors)
+    lexical = BM25Index.build(tree['pages'])
+
+    return {
+        "extract_to_tree": lambda: extract_to_tree(fixture.elements),
+        "extract_to_tree_v3": lambda: extract_to_tree_v3(fixture.elements),
+        "extract_to_tree_v4": lambda: extract_to_tree_v4(fixture.elements),
+        "fetch_pages": lambda: functions.fetch_pages(tree, fixture.rng.sample(page_numbers, min(5, len(page_numbers)))),
+        "fetch_section": lambda: functions.fetch_section(tree, None, fixture.rng.choice(titles)),
+        "divide_into_chunks": lambda: functions.divide_into_chunks(fixture.pages_text, 100),
+        "iter_chunks": lambda: list(chunking.iter_chunks(tree)),
+        "vector_store.build": lambda: functions.VectorStore(fixture.vectors),
+        "vector_store.neighbors": lambda: store.neighbors(fixture.queries[0], 4),
+        "vector_store.neighbors_batch": lambda: store.neighbors_batch(fixture.queries, 4),
+        "bm25.build": lambda: BM25Index.build(tree['pages']),
+        "bm25.search": lambda: lexical.search("pressure signal error", 4),
+        "search.embedding": lambda: functions.search(tree, None, "pressure signal error", backend="embedding"),
+        "search.hybrid": lambda: functions.search(tree, None, "pressure signal error", backend="hybrid"),
+        "ask_question": lambda: functions.ask_question(
+            "What is the pressure?", str(fixture.extract_path), str(fixture.tree_path)),
+        "ask_question_retrieval_pages": lambda: functions.ask_question_retrieval_pages(
+            "What is the pressure?", str(fixture.extract_path), str(fixture.tree_path)),
+    }
+
+
+def measure(
+        fn: Callable[[], object],
+        repeat: int,
+) -> dict[str, float]:
+    fn()
+
+    # Like timeit, keep the cyclic collector out of the timings, and out of
+    # the traced run, so a collection of earlier garbage isn't charged to it.
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds_median": statistics.median(timings),
+        "seconds_min": min(timings),
+        "repeat": repeat,
+        "peak_bytes": peak,
+    }
+
+
+def compare(
+        results: dict[str, dict],
+        baseline: dict[str, dict],
+        time_tolerance: float,
+        memory_tolerance: float,
+) -> list[dict]:
+    """
+    One row per case present in both runs, with time and memory ratios to
+    the baseline and whether either exceeds its tolerance.
+    """
+    rows = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or "error" in result or "error" in base:
+            continue
+        # The best run is much less sensitive to machine noise than the median.
+        time_ratio = result["seconds_min"] / base["seconds_min"] if base["seconds_min"] else 1.0
+        memory_ratio = result["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] else 1.0
+        rows.append({
+            "name": name,
+            "time_ratio": time_ratio,
+            "memory_ratio": memory_ratio,
+            "regressed": time_ratio > 1 + time_tolerance or memory_ratio > 1 + memory_tolerance,
+        })
+    return rows
+
+
+@click.command()
+@click.option("--pages", type=int, default=200, show_default=True)
+@click.option("--elements-per-page", type=int, default=20, show_default=True)
+@click.option("--depth", type=int, default=3, show_default=True)
+@click.option("--vectors", type=int, default=10_000, show_default=True, help="Rows in the VectorStore cases.")
+@click.option("--dim", type=int, default=1536, show_default=True)
+@click.option("--repeat", type=int, default=5, show_default=True)
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--case", "selected", multiple=True, help="Only run these cases (repeatable).")
+@click.option("--output", "output_path", type=Path, default=None, help="Write results as JSON.")
+@click.option("--baseline", "baseline_path", type=Path, default=None, help="Results JSON to compare against.")
+@click.option("--time-tolerance", type=float, default=0.2, show_default=True,
+              help="Allowed fractional slowdown of the best time.")
+@click.option("--memory-tolerance", type=float, default=0.1, show_default=True,
+              help="Allowed fractional growth of peak memory.")
+def main(
+        pages: int,
+        elements_per_page: int,
+        depth: int,
+        vectors: int,
+        dim: int,
+        repeat: int,
+        seed: int,
+        selected: list[str],
+        output_path: Path | None,
+        baseline_path: Path | None,
+        time_tolerance: float,
+        memory_tolerance: float,
+):
+    config = {"pages": pages, "elements_per_page": elements_per_page, "depth": depth,
+              "vectors": vectors, "dim": dim, "repeat": repeat, "seed": seed}
+
+    install_stubs()
+    directory = Path(tempfile.mkdtemp(prefix="pdftriage-bench-"))
+    fixture = build_fixture(pages, elements_per_page, depth, vectors, dim, seed, directory)
+    benchmarks = cases(fixture)
+    unknown = set(selected) - set(benchmarks)
+    if unknown:
+        raise click.BadParameter(f"Unknown cases {sorted(unknown)}; expected some of {sorted(benchmarks)}")
+
+    results = {}
+    print(f"{'case':>30} {'median (ms)':>12} {'min (ms)':>10} {'peak (MB)':>10}")
+    for name, fn in benchmarks.items():
+        if selected and name not in selected:
+            continue
+        try:
+            results[name] = measure(fn, repeat)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"{name:>30}   failed: {results[name]['error']}")
+            continue
+        result = results[name]
+        print(f"{name:>30} {result['seconds_median'] * 1e3:>12.3f} {result['seconds_min'] * 1e3:>10.3f} "
+              f"{result['peak_bytes'] / 1024 ** 2:>10.2f}")
+
+    shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "config": config,
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "numpy": numpy.__version__},
+        "results": results,
+    }
+    if output_path is not None:
+        with output_path.open("w") as f:
+            json.dump(report, f, indent=2)
+
+    if baseline_path is None:
+        return
+    with baseline_path.open() as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        print(f"Warning: baseline was run with {baseline.get('config')}, this run with {config}")
+
+    rows = compare(results, baseline["results"], time_tolerance, memory_tolerance)
+    print(f"\n{'case':>30} {'time':>8} {'memory':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regressed"] else ""
+        print(f"{row['name']:>30} {row['time_ratio']:>7.2f}x {row['memory_ratio']:>7.2f}x{flag}")
+    regressions = [row["name"] for row in rows if row["regressed"]]
+    if regressions:
+        print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Token-window chunking of a document tree for chunk-level retrieval.
+
+Each page (or, with by="section", each section) is encoded with
+metadata_packing.get_encoder and cut into windows of `chunk_tokens` tokens,
+consecutive windows sharing `overlap` tokens. Windows never cross a page or
+section boundary, so every chunk knows which pages it came from. Chunks are
+generated one unit at a time: only the unit being cut is ever encoded in
+memory. Where tiktoken's encodings can't be downloaded, the encoder falls
+back to regex words, as the original divide_into_chunks counted.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Iterator
+
+from metadata_packing import get_encoder
+
+
+CHUNK_TOKENS = 128
+CHUNK_OVERLAP = 32
+CHUNK_MODEL = "text-embedding-ada-002"
+
+
+@dataclass(frozen=True)
+class Chunk:
+    text: str
+    pages: tuple[int, ...]
+    section: str | None
+    tokens: int
+
+
+def token_windows(
+        text: str,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap: int = CHUNK_OVERLAP,
+        model: str = CHUNK_MODEL,
+) -> Iterator[tuple[str, int]]:
+    """
+    Yields (text, token count) windows of `text`. The last window of a unit
+    is never just the overlap of the one before it.
+    """
+    if not 0 <= overlap < chunk_tokens:
+        raise ValueError(f"overlap must be in [0, {chunk_tokens}), got {overlap}")
+
+    encoder = get_encoder(model)
+    tokens = encoder.encode(text, disallowed_special=())
+    step = chunk_tokens - overlap
+    for start in range(0, max(len(tokens) - overlap, 1), step):
+        window = tokens[start:start + chunk_tokens]
+        if window:
+            yield encoder.decode(window), len(window)
+
+
+def iter_chunks(
+        tree: dict,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap: int = CHUNK_OVERLAP,
+        by: str = "page",
+        model: str = CHUNK_MODEL,
+) -> Iterator[Chunk]:
+    """
+    Chunks of `tree` in document order, cut within pages (`by="page"`) or
+    within sections (`by="section"`).
+    """
+    if by == "page":
+        for page, text in tree['pages'].items():
+            for window, count in token_windows(text, chunk_tokens, overlap, model):
+                if window.strip():
+                    yield Chunk(window, (int(page),), None, count)
+    elif by == "section":
+        for section in tree['sections']:
+            pages = tuple(int(page) for page in section['pages'])
+            for window, count in token_windows(section['text'], chunk_tokens, overlap, model):
+                if window.strip():
+                    yield Chunk(window, pages, section['title'], count)
+    else:
+        raise ValueError(f"Unknown chunk boundary {by!r}")
@@ -0,0 +1,165 @@
+"""
+Record/replay cache for chat-completion requests.
+
+Requests are keyed by a hash of their canonical JSON (model, messages,
+functions and sampling parameters, with sorted keys), and responses are kept
+in a local SQLite file. Three modes:
+
+- "record": serve cached responses, call the API on a miss and store the result
+- "replay": serve cached responses only, and raise CompletionCacheMiss on a miss
+- "passthrough": always call the API and store nothing
+
+The mode and path default to $PDFTRIAGE_COMPLETION_CACHE_MODE (passthrough)
+and $PDFTRIAGE_COMPLETION_CACHE (data/completion_cache.sqlite).
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Callable
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+MODES = ("record", "replay", "passthrough")
+
+DEFAULT_CACHE_PATH = os.environ.get("PDFTRIAGE_COMPLETION_CACHE", "data/completion_cache.sqlite")
+DEFAULT_MODE = os.environ.get("PDFTRIAGE_COMPLETION_CACHE_MODE", "passthrough")
+
+
+class CompletionCacheMiss(KeyError):
+    pass
+
+
+def _to_plain(
+        value: Any
+) -> Any:
+    # openai's response objects are dict subclasses with extra state; make
+    # sure only plain JSON types end up in the key and the stored response.
+    if isinstance(value, dict):
+        return {str(k): _to_plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_plain(v) for v in value]
+    return value
+
+
+def request_key(
+        request: dict
+) -> str:
+    canonical = json.dumps(_to_plain(request), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+
+    def __init__(
+            self,
+            path: str | Path = DEFAULT_CACHE_PATH,
+            mode: str = DEFAULT_MODE,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown completion cache mode {mode!r}, expected one of {MODES}")
+        self.path = Path(path)
+        self.mode = mode
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._db = None
+        if mode != "passthrough":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    request TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+            self._db.commit()
+
+    def stats(self) -> dict[str, int | str]:
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
+
+    def get(
+            self,
+            request: dict
+    ) -> dict | None:
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM completions WHERE key = ?", (request_key(request),)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(
+            self,
+            request: dict,
+            response: dict,
+    ) -> None:
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, request, response, created) VALUES (?, ?, ?, ?)",
+                (request_key(request), json.dumps(_to_plain(request)), json.dumps(_to_plain(response)), time.time())
+            )
+            self._db.commit()
+
+    def complete(
+            self,
+            request: dict,
+            create: Callable[..., Any],
+    ) -> Any:
+        """
+        Returns the cached response for `request`, or calls `create(**request)`
+        as the mode allows. Cached responses come back as plain dicts.
+        """
+        if self.mode == "passthrough":
+            return create(**request)
+
+        cached = self.get(request)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        if self.mode == "replay":
+            raise CompletionCacheMiss(f"No recorded completion for request {request_key(request)[:12]}")
+
+        response = create(**request)
+        self.put(request, response)
+        return response
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+_cache: CompletionCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache() -> CompletionCache:
+    global _cache
+    if _cache is None:
+        # Worker threads may ask at the same time; only one may open it.
+        with _cache_lock:
+            if _cache is None:
+                _cache = CompletionCache()
+    return _cache
+
+
+def set_completion_cache(
+        cache: CompletionCache | None
+) -> None:
+    global _cache
+    _cache = cache
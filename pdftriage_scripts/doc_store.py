@@ -0,0 +1,219 @@
+"""
+Compact binary document format with lazy, memory-mapped access.
+
+Written by extract_metadata next to each -metadata.json as -metadata.bin:
+
+    8 bytes     magic b"PDFTDOC1"
+    4 bytes     little-endian u32 header length
+    header      UTF-8 JSON: {"version", "pages": count, "sections": [{"title", "pages"}]}
+    padding     to an 8-byte boundary
+    int64[P]    page numbers
+    int64[P+1]  page text offsets into the text blob
+    int64[S+1]  section text offsets into the text blob
+    text blob   page texts, then section texts, UTF-8
+
+`open_document` only parses the header (the table of contents); page and
+section text is decoded from the mapping when it is first accessed.
+"""
+from __future__ import annotations
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import Any, Iterator
+
+import json
+import mmap
+import struct
+
+from page_store import PageStore
+
+
+MAGIC = b"PDFTDOC1"
+FORMAT_VERSION = 1
+
+
+def binary_path_for(
+        tree_path: str | Path
+) -> Path:
+    return Path(tree_path).with_suffix(".bin")
+
+
+def write_document(
+        path: str | Path,
+        metadata: dict,
+) -> None:
+    """
+    Writes `metadata` ({"pages": {page: text}, "sections": [{"title", "pages",
+    "text"}]}) in the binary format.
+    """
+    pages = metadata['pages']
+    sections = metadata['sections']
+
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "pages": len(pages),
+        "sections": [{"title": section['title'], "pages": section['pages']} for section in sections],
+    }).encode("utf-8")
+    padding = -(len(MAGIC) + 4 + len(header)) % 8
+
+    texts = [text.encode("utf-8") for text in pages.values()]
+    texts += [section['text'].encode("utf-8") for section in sections]
+    offsets = [0]
+    for text in texts:
+        offsets.append(offsets[-1] + len(text))
+    page_offsets = offsets[:len(pages) + 1]
+    section_offsets = offsets[len(pages):]
+
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(b"\0" * padding)
+        f.write(struct.pack(f"<{len(pages)}q", *[int(page) for page in pages]))
+        f.write(struct.pack(f"<{len(page_offsets)}q", *page_offsets))
+        f.write(struct.pack(f"<{len(section_offsets)}q", *section_offsets))
+        for text in texts:
+            f.write(text)
+    tmp_path.replace(path)
+
+
+class LazyPages(Mapping):
+    """
+    page -> text, keyed by strings like a JSON-loaded tree.
+    """
+
+    def __init__(
+            self,
+            store: PageStore,
+    ) -> None:
+        self.store = store
+
+    def __getitem__(self, key) -> str:
+        text = self.store.page(int(key)) if str(key).isdigit() else None
+        if text is None:
+            raise KeyError(key)
+        return text
+
+    def __iter__(self) -> Iterator[str]:
+        return (str(page) for page in self.store.page_numbers)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+
+class LazySection(Mapping):
+
+    _keys = ("title", "pages", "text")
+
+    def __init__(
+            self,
+            document: LazyDocument,
+            ix: int,
+    ) -> None:
+        self._document = document
+        self._ix = ix
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "text":
+            return self._document._section_text(self._ix)
+        if key in ("title", "pages"):
+            return self._document.toc[self._ix][key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class LazySections(Sequence):
+
+    def __init__(
+            self,
+            document: LazyDocument,
+    ) -> None:
+        self._document = document
+
+    def __getitem__(self, ix):
+        if isinstance(ix, slice):
+            return [self[i] for i in range(*ix.indices(len(self)))]
+        if ix < 0:
+            ix += len(self)
+        if not 0 <= ix < len(self):
+            raise IndexError(ix)
+        return LazySection(self._document, ix)
+
+    def __len__(self) -> int:
+        return len(self._document.toc)
+
+
+class LazyDocument(Mapping):
+    """
+    Read-only stand-in for a loaded -metadata.json tree: `doc['pages']` and
+    `doc['sections']` behave like the JSON structures but decode text on access.
+    """
+
+    def __init__(
+            self,
+            path: str | Path,
+    ) -> None:
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{self.path} is not a PDFTriage document file")
+        (header_length,) = struct.unpack_from("<I", view, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(view[start:start + header_length]))
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported document format version {header.get('version')}")
+
+        self.toc = header["sections"]
+        page_count = header["pages"]
+        section_count = len(self.toc)
+
+        position = start + header_length
+        position += -position % 8
+        # The tables are written little-endian and cast in native order,
+        # which is the same on every platform we run on.
+        tables = view[position:position + 8 * (2 * page_count + section_count + 2)].cast("q")
+        page_numbers = tables[:page_count]
+        page_offsets = tables[page_count:2 * page_count + 1]
+        self._section_offsets = tables[2 * page_count + 1:]
+        self._blob = view[position + tables.nbytes:]
+        # What stays in memory once opened; the text blob is paged in by
+        # the OS on access.
+        self.index_bytes = position + tables.nbytes
+
+        self.page_store = PageStore(self._blob, page_numbers, page_offsets)
+        self._pages = LazyPages(self.page_store)
+        self._sections = LazySections(self)
+
+    def _section_text(
+            self,
+            ix: int,
+    ) -> str:
+        return str(self._blob[self._section_offsets[ix]:self._section_offsets[ix + 1]], "utf-8")
+
+    def __getitem__(self, key: str):
+        if key == "pages":
+            return self._pages
+        if key == "sections":
+            return self._sections
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(("pages", "sections"))
+
+    def __len__(self) -> int:
+        return 2
+
+
+def open_document(
+        path: str | Path
+) -> LazyDocument:
+    return LazyDocument(path)
@@ -0,0 +1,311 @@
+"""
+Process-wide cache of loaded documents.
+
+`load_tree` and parsed LazyExtract handles go through one shared cache, so
+the four evaluation strategies, and every question about the same PDF, load
+each file once. Entries are keyed by (kind, path, mtime, size), so a
+rewritten file is reloaded, and the least recently used entries are evicted
+once the resident size of the loaded documents passes `max_bytes`. Parsed
+JSON takes several times its file size in memory, so loaders report
+`resident_bytes` of what they return, not the size on disk.
+
+Structures built from a cached document (indexes, chunks, vector stores)
+are kept on its entry with `derived`. They count against `max_bytes` and
+are evicted with the document.
+
+Cached values are shared between callers, so they are handed out frozen:
+pages and sections are read-only mappings and lists become tuples. A caller
+that needs to modify a document should take its own copy with `thaw`.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable
+
+import os
+import sys
+import threading
+
+
+DEFAULT_MAX_BYTES = int(os.environ.get("PDFTRIAGE_DOCUMENT_CACHE_BYTES", 2 * 1024 ** 3))
+
+
+def freeze(
+        value: Any
+) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(
+        value: Any
+) -> Any:
+    """
+    A plain, mutable deep copy of a frozen (or lazy) document.
+    """
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, Sequence) and not isinstance(value, str):
+        return [thaw(v) for v in value]
+    return value
+
+
+def resident_bytes(
+        value: Any
+) -> int:
+    """
+    Memory held by a parsed (or frozen) JSON value, or by a structure built
+    from one: the containers, objects, arrays and scalars it references, each
+    counted once. Parts shared with another value are counted again, so the
+    estimate for a derived structure errs high. Memory-mapped data is paged
+    by the OS and isn't counted.
+    """
+    seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, MappingProxyType):
+            # The proxy is a thin view; count the dict behind it too.
+            total += sys.getsizeof(dict(item))
+        if isinstance(item, Mapping):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif isinstance(item, (str, bytes, int, float, bool, type(None))):
+            continue
+        elif isinstance(item, memoryview):
+            stack.append(item.obj)
+        elif getattr(item, "base", None) is not None and hasattr(item, "nbytes"):
+            # A numpy view; its data is held by the base array.
+            stack.append(item.base)
+        else:
+            if hasattr(item, "__dict__"):
+                stack.extend(vars(item).values())
+            for cls in type(item).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    if hasattr(item, slot):
+                        stack.append(getattr(item, slot))
+    return total
+
+
+class _Entry:
+
+    __slots__ = ('document', 'size', 'derived')
+
+    def __init__(
+            self,
+            document: Any,
+            size: int,
+    ) -> None:
+        self.document = document
+        self.size = size
+        self.derived: dict[str, Any] = {}
+
+
+class DocumentCache:
+
+    def __init__(
+            self,
+            max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.bytes_resident = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        # id(document) -> key, for `derived`; entries hold their document, so
+        # its id can't be reused while it is cached.
+        self._keys: dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        self._loading: dict[tuple, threading.Lock] = {}
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes_resident": self.bytes_resident,
+        }
+
+    def get(
+            self,
+            kind: str,
+            path: str | Path,
+            load: Callable[[Path], tuple],
+    ) -> Any:
+        """
+        Returns the cached `kind` document for `path`, calling `load(path)`
+        on a miss. `load` returns (document, resident bytes), optionally
+        followed by a {name: value} dict of structures derived while loading.
+        Concurrent misses for the same file load it once.
+        """
+        path = Path(path)
+        stat = path.stat()
+        key = (kind, str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key].document
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key].document
+                self.misses += 1
+
+            try:
+                document, size, *loaded = load(path)
+                derived = {name: (value, resident_bytes(value)) for name, value in (loaded[0] if loaded else {}).items()}
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+
+            with self._lock:
+                entry = _Entry(document, size)
+                self._entries[key] = entry
+                self._keys[id(document)] = key
+                self.bytes_resident += size
+                for name, (value, value_size) in derived.items():
+                    self._attach(entry, name, value, value_size)
+                self._evict()
+        return document
+
+    def derived(
+            self,
+            document: Any,
+            name: str,
+            build: Callable[[Any], Any],
+    ) -> Any:
+        """
+        The `name` structure built from a cached document, calling
+        `build(document)` once on first use, outside the cache's lock. A
+        document that isn't (or is no longer) cached gets a fresh build each
+        time.
+        """
+        with self._lock:
+            entry = self._entry(document)
+            if entry is None:
+                building = None
+            elif name in entry.derived:
+                return entry.derived[name]
+            else:
+                building = self._loading.setdefault((id(document), name), threading.Lock())
+
+        if building is None:
+            return build(document)
+
+        with building:
+            with self._lock:
+                if name in entry.derived:
+                    return entry.derived[name]
+            try:
+                value = build(document)
+                size = resident_bytes(value)
+            finally:
+                with self._lock:
+                    self._loading.pop((id(document), name), None)
+
+            with self._lock:
+                if self._entry(document) is entry and name not in entry.derived:
+                    self._attach(entry, name, value, size)
+                    self._evict()
+        return value
+
+    def set_derived(
+            self,
+            document: Any,
+            name: str,
+            value: Any,
+    ) -> None:
+        size = resident_bytes(value)
+        with self._lock:
+            entry = self._entry(document)
+            if entry is not None:
+                if name in entry.derived:
+                    old_size = resident_bytes(entry.derived[name])
+                    entry.size -= old_size
+                    self.bytes_resident -= old_size
+                self._attach(entry, name, value, size)
+                self._evict()
+
+    def _entry(
+            self,
+            document: Any,
+    ) -> _Entry | None:
+        # Called with the lock held.
+        key = self._keys.get(id(document))
+        entry = self._entries.get(key) if key is not None else None
+        if entry is None or entry.document is not document:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _attach(
+            self,
+            entry: _Entry,
+            name: str,
+            value: Any,
+            size: int,
+    ) -> None:
+        # Called with the lock held.
+        entry.derived[name] = value
+        entry.size += size
+        self.bytes_resident += size
+
+    def _evict(self) -> None:
+        # Called with the lock held. Always keeps the most recently used
+        # entry, even if it alone is over budget.
+        while self.bytes_resident > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._keys.pop(id(entry.document), None)
+            self.bytes_resident -= entry.size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self.bytes_resident = 0
+
+
+_cache: DocumentCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_document_cache() -> DocumentCache:
+    global _cache
+    if _cache is None:
+        # Worker threads may ask at the same time; only one may open it.
+        with _cache_lock:
+            if _cache is None:
+                _cache = DocumentCache()
+    return _cache
+
+
+def set_document_cache(
+        cache: DocumentCache | None
+) -> None:
+    global _cache
+    _cache = cache
@@ -0,0 +1,169 @@
+"""
+Embedding backends for dense retrieval.
+
+`search` and `perform_retrieval` embed through whichever backend
+PDFTRIAGE_EMBEDDING_BACKEND names (or `set_embedding_backend` installs):
+
+- "openai": text-embedding-ada-002 over the API, through the embedding cache
+  and the token-aware batcher
+- "hashing": a local, dependency-free hashing vectorizer over word unigrams
+  and bigrams, for air-gapped runs and for benchmarks that shouldn't be
+  dominated by API latency
+
+The spaCy quality_model in docinstruct-v0 is a bag-of-words text classifier
+trained without static vectors, so it has no word vectors to pool.
+"""
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+import os
+import zlib
+
+import numpy
+
+from embedding_batcher import embed_batched
+from embedding_cache import get_embedding_cache
+from lexical_index import tokenize
+
+
+DEFAULT_BACKEND = os.environ.get("PDFTRIAGE_EMBEDDING_BACKEND", "openai")
+HASHING_DIM = 1024
+
+
+class EmbeddingBackend(ABC):
+    """
+    Maps texts to a float32 matrix with one embedding per row.
+    """
+
+    name: str
+
+    @abstractmethod
+    def embed(
+            self,
+            texts: list[str],
+    ) -> numpy.ndarray:
+        ...
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+
+    name = "openai"
+
+    def __init__(
+            self,
+            model: str = "text-embedding-ada-002",
+    ) -> None:
+        self.model = model
+
+    def embed(
+            self,
+            texts: list[str],
+    ) -> numpy.ndarray:
+        """
+        Embeddings are looked up in the content-addressed cache first, so only
+        texts that have never been embedded with this model go over the
+        network, in token-bounded batches sent concurrently.
+        """
+        cache = get_embedding_cache()
+        embeddings = cache.get_many(self.model, texts)
+
+        missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+        if missing:
+            fetched = embed_batched(missing, self.model)
+            cache.put_many(self.model, missing, fetched)
+
+            by_text = dict(zip(missing, fetched))
+            embeddings = [by_text[t] if e is None else e for t, e in zip(texts, embeddings)]
+
+        if not embeddings:
+            return numpy.empty((0, 0), dtype=numpy.float32)
+        return numpy.stack(embeddings)
+
+
+@lru_cache(maxsize=1 << 20)
+def _hash_feature(
+        feature: str,
+        dim: int,
+) -> tuple[int, float]:
+    h = zlib.crc32(feature.encode("utf-8"))
+    # The top bit picks the sign, so colliding features tend to cancel
+    # rather than pile up.
+    return h % dim, -1.0 if h & 0x80000000 else 1.0
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+
+    name = "hashing"
+
+    def __init__(
+            self,
+            dim: int = HASHING_DIM,
+            bigrams: bool = True,
+    ) -> None:
+        self.dim = dim
+        self.bigrams = bigrams
+
+    def _features(
+            self,
+            text: str,
+    ) -> list[str]:
+        tokens = tokenize(text)
+        if self.bigrams:
+            return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return tokens
+
+    def embed(
+            self,
+            texts: list[str],
+    ) -> numpy.ndarray:
+        """
+        Sublinear (log) term frequencies of hashed features, L2-normalized.
+        Feature counts for the whole batch are accumulated with one scatter-add.
+        """
+        rows, columns, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                column, sign = _hash_feature(feature, self.dim)
+                rows.append(row)
+                columns.append(column)
+                signs.append(sign)
+
+        matrix = numpy.zeros((len(texts), self.dim), dtype=numpy.float32)
+        numpy.add.at(matrix, (numpy.asarray(rows, dtype=numpy.intp), numpy.asarray(columns, dtype=numpy.intp)),
+                     numpy.asarray(signs, dtype=numpy.float32))
+        matrix = numpy.sign(matrix) * numpy.log1p(numpy.abs(matrix))
+
+        norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+
+EMBEDDING_BACKENDS = {
+    OpenAIEmbeddingBackend.name: OpenAIEmbeddingBackend,
+    HashingEmbeddingBackend.name: HashingEmbeddingBackend,
+}
+
+_backend: EmbeddingBackend | None = None
+
+
+def make_embedding_backend(
+        name: str
+) -> EmbeddingBackend:
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {name!r}; expected one of {sorted(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[name]()
+
+
+def get_embedding_backend() -> EmbeddingBackend:
+    global _backend
+    if _backend is None:
+        _backend = make_embedding_backend(DEFAULT_BACKEND)
+    return _backend
+
+
+def set_embedding_backend(
+        backend: EmbeddingBackend | None
+) -> None:
+    global _backend
+    _backend = backend
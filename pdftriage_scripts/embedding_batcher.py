@@ -0,0 +1,101 @@
+"""
+Token-aware batching for the embeddings endpoint.
+
+A single `openai.Embedding.create` call is limited both in the number of
+inputs and in the tokens per input and per request, so embedding every page
+of a large document at once fails. `embed_batched` deduplicates its inputs,
+packs them in order into batches under those limits (counting tokens with
+tiktoken), sends the batches concurrently on a bounded thread pool and
+reassembles the embeddings in input order.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import os
+
+import numpy
+import openai
+
+from metadata_packing import count_tokens, truncate_tokens
+
+
+MAX_INPUT_TOKENS = 8191
+MAX_BATCH_TOKENS = int(os.environ.get("PDFTRIAGE_EMBED_BATCH_TOKENS", 100_000))
+MAX_BATCH_INPUTS = 2048
+EMBED_WORKERS = int(os.environ.get("PDFTRIAGE_EMBED_WORKERS", 4))
+
+
+def token_batches(
+        token_counts: list[int],
+        max_tokens: int = MAX_BATCH_TOKENS,
+        max_inputs: int = MAX_BATCH_INPUTS,
+) -> list[range]:
+    """
+    Splits inputs with the given token counts into consecutive runs of at
+    most `max_inputs` inputs and `max_tokens` tokens. An input larger than
+    `max_tokens` gets a batch of its own.
+    """
+    batches = []
+    start, tokens = 0, 0
+    for ix, count in enumerate(token_counts):
+        if ix > start and (tokens + count > max_tokens or ix - start >= max_inputs):
+            batches.append(range(start, ix))
+            start, tokens = ix, 0
+        tokens += count
+    if start < len(token_counts):
+        batches.append(range(start, len(token_counts)))
+    return batches
+
+
+def _create_embeddings(
+        texts: list[str],
+        model: str,
+) -> list[numpy.ndarray]:
+    response = openai.Embedding.create(input=texts, model=model)
+    data = sorted(response['data'], key=lambda item: item['index'])
+    return [numpy.array(item['embedding'], dtype=numpy.float32) for item in data]
+
+
+def embed_batched(
+        texts: list[str],
+        model: str = "text-embedding-ada-002",
+        workers: int = EMBED_WORKERS,
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        max_batch_inputs: int = MAX_BATCH_INPUTS,
+        create: Callable[[list[str], str], list[numpy.ndarray]] = _create_embeddings,
+) -> list[numpy.ndarray]:
+    """
+    One float32 embedding per text, in order. Identical texts are embedded
+    once; texts over the model's input limit are truncated to it.
+    """
+    unique = list(dict.fromkeys(texts))
+    if not unique:
+        return []
+
+    inputs = []
+    token_counts = []
+    for text in unique:
+        count = count_tokens(text, model)
+        if count > MAX_INPUT_TOKENS:
+            text, count = truncate_tokens(text, MAX_INPUT_TOKENS, model), MAX_INPUT_TOKENS
+        # The endpoint rejects empty strings.
+        inputs.append(text or " ")
+        token_counts.append(max(count, 1))
+
+    batches = token_batches(token_counts, max_batch_tokens, max_batch_inputs)
+
+    def run(batch: range) -> list[numpy.ndarray]:
+        return create([inputs[ix] for ix in batch], model)
+
+    if len(batches) == 1 or workers <= 1:
+        results = [run(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+            results = list(pool.map(run, batches))
+
+    by_text = {}
+    for batch, embeddings in zip(batches, results):
+        for ix, embedding in zip(batch, embeddings):
+            by_text[unique[ix]] = embedding
+    return [by_text[text] for text in texts]
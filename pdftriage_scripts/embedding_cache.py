@@ -0,0 +1,246 @@
+"""
+Content-addressed embedding cache.
+
+Embeddings are keyed by a hash of (model, text), so the same page embedded for
+two different questions is only sent to the API once. Lookups go through an
+in-memory LRU first and then an on-disk SQLite store, which is kept under a
+configurable size by evicting the least recently used rows.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy
+
+
+DEFAULT_CACHE_PATH = os.environ.get("PDFTRIAGE_EMBEDDING_CACHE", "data/embedding_cache.sqlite")
+DEFAULT_MAX_DISK_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_MEMORY_ITEMS = 50_000
+
+
+def embedding_key(
+        model: str,
+        text: str,
+) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+
+    def __init__(
+            self,
+            path: str | Path | None = DEFAULT_CACHE_PATH,
+            max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+            max_memory_items: int = DEFAULT_MAX_MEMORY_ITEMS,
+    ) -> None:
+        self.path = Path(path) if path is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_items = max_memory_items
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._memory: OrderedDict[str, numpy.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_bytes = 0
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)")
+            self._db.commit()
+            # Kept up to date by put_many and _evict, so inserts don't sum
+            # the whole table.
+            (self._disk_bytes,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "disk_bytes": self.disk_bytes(),
+        }
+
+    def reset_stats(self) -> None:
+        self.memory_hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def disk_bytes(self) -> int:
+        with self._lock:
+            return self._disk_bytes
+
+    def get_many(
+            self,
+            model: str,
+            texts: list[str],
+    ) -> list[numpy.ndarray | None]:
+        """
+        Returns the cached embedding for each text, or None where it is missing.
+        """
+        keys = [embedding_key(model, text) for text in texts]
+        results: list[numpy.ndarray | None] = [None] * len(keys)
+        on_disk = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    results[i] = self._memory[key]
+                    self.memory_hits += 1
+                else:
+                    on_disk.setdefault(key, []).append(i)
+
+            if on_disk and self._db is not None:
+                found = self._select(list(on_disk))
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE embeddings SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._db.commit()
+                for key, vector in found.items():
+                    self._remember(key, vector)
+                    for i in on_disk.pop(key):
+                        results[i] = vector
+                        self.disk_hits += 1
+
+            self.misses += sum(len(ixs) for ixs in on_disk.values())
+
+        return results
+
+    def put_many(
+            self,
+            model: str,
+            texts: list[str],
+            vectors: list[numpy.ndarray],
+    ) -> None:
+        rows = []
+        now = time.time()
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = embedding_key(model, text)
+                vector = numpy.ascontiguousarray(vector, dtype=numpy.float32)
+                self._remember(key, vector)
+                blob = vector.tobytes()
+                rows.append((key, blob, len(blob), now))
+
+            if self._db is not None and rows:
+                replaced = self._sizes(list({key for key, _, _, _ in rows}))
+                self._disk_bytes += sum(size for size in {key: size for key, _, size, _ in rows}.values())
+                self._disk_bytes -= sum(replaced.values())
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, size, accessed) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._db.commit()
+                self._evict()
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _sizes(
+            self,
+            keys: list[str],
+    ) -> dict[str, int]:
+        sizes = {}
+        for start in range(0, len(keys), 900):
+            batch = keys[start:start + 900]
+            placeholders = ",".join("?" * len(batch))
+            sizes.update(self._db.execute(f"SELECT key, size FROM embeddings WHERE key IN ({placeholders})", batch))
+        return sizes
+
+    def _select(
+            self,
+            keys: list[str],
+    ) -> dict[str, numpy.ndarray]:
+        found = {}
+        # Stay under SQLite's default limit on bound parameters.
+        for start in range(0, len(keys), 900):
+            batch = keys[start:start + 900]
+            placeholders = ",".join("?" * len(batch))
+            for key, blob in self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch):
+                found[key] = numpy.frombuffer(blob, dtype=numpy.float32)
+        return found
+
+    def _remember(
+            self,
+            key: str,
+            vector: numpy.ndarray,
+    ) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self) -> None:
+        total = self._disk_bytes
+        if total <= self.max_disk_bytes:
+            return
+
+        # Drop the least recently used rows until we are back under 90% of the
+        # budget, so we don't pay for an eviction on every insert.
+        target = total - int(self.max_disk_bytes * 0.9)
+        freed = 0
+        stale = []
+        for key, size in self._db.execute("SELECT key, size FROM embeddings ORDER BY accessed ASC"):
+            stale.append((key,))
+            freed += size
+            if freed >= target:
+                break
+
+        self._db.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+        self._db.commit()
+        self._disk_bytes -= freed
+        self.evictions += len(stale)
+
+
+_cache: EmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        # Worker threads may ask at the same time; only one may open it.
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
+
+
+def set_embedding_cache(
+        cache: EmbeddingCache | None
+) -> None:
+    """
+    Replace the process-wide cache, e.g. with EmbeddingCache(path=None) for a
+    memory-only cache in tests and benchmarks.
+    """
+    global _cache
+    _cache = cache
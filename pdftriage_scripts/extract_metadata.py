@@ -1,11 +1,16 @@
 from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from pydantic import BaseModel
-from typing import Any
+from typing import Any, Iterable, Iterator, TextIO
+from doc_store import binary_path_for, write_document
+from lexical_index import BM25Index, index_path_for
 
 import click
+import hashlib
+import io
 import json
-from pathlib import Path
+import os
+import time
 
 
 def part_to_tuple(
@@ -18,49 +23,95 @@ def part_to_tuple(
 
 meta_sections = []
 
-class Node(BaseModel):
-    page: int | None = None
-    type: str
-    text: str
-
-    children: dict[str, Node] = {}
+class Node:
+    """
+    A node of the Extract structure tree.
+
+    `pages` and `title` are computed bottom-up in one pass by `finalize()`,
+    which the tree builders call once the tree is complete, and cached on each
+    node. Call `finalize()` again after modifying a built tree.
+    """
+
+    __slots__ = ('page', 'type', 'text', 'children', '_pages', '_title')
+
+    def __init__(
+            self,
+            type: str,
+            text: str,
+            page: int | None = None,
+            children: dict[tuple[str, int], Node] | None = None,
+    ) -> None:
+        self.page = page
+        self.type = type
+        self.text = text
+        self.children = children if children is not None else {}
+        self._pages = None
+        self._title = None
+
+    def __repr__(self) -> str:
+        return f"Node(type={self.type!r}, page={self.page!r}, text={self.text[:30]!r}, children={len(self.children)})"
+
+    def finalize(self) -> Node:
+        # Iterative post-order walk so deep trees don't hit the recursion limit.
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node.children and not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children.values())
+                continue
+
+            if not node.children:
+                node._pages = [node.page] if node.page else []
+                node._title = None
+                continue
+
+            node._pages = sorted({p for c in node.children.values() for p in c._pages})
+            node._title = None
+            for child in node.children.values():
+                if child.type == 'Title' or child.type.startswith('H'):
+                    node._title = child.text
+                    break
+                if child._title is not None:
+                    node._title = child._title
+                    break
+        return self
 
     @property
-    def pages(self) -> list[str]:
-        #return self.page
-        if len(self.children) == 0 and self.page: return [self.page]
-        #elif len(self.children) == 0 and not self.page: return []
-
-        return sorted(set([p for c in self.children.values() for p in c.pages]))
+    def pages(self) -> list[int]:
+        if self._pages is None:
+            self.finalize()
+        return self._pages
     
     @property
     def sections(self) -> list[dict[str, Any]]:
-        
-        if len(self.children) == 0:
-            return [[{'pages': self.pages}, {'type': self.type}, 
-                     {'title': self.title}, {'text': self.text}]]
-        else:
-            sections = [{'pages': self.pages}, {'type': self.type}, 
-                        {'title': self.title}, {'text': self.text}]
-            for _, child in self.children.items():
-                sections.extend(child.sections)
-            return sections
+        if self._pages is None:
+            self.finalize()
+        sections = []
+        self._collect_sections(sections)
+        # Leaves contribute their fields wrapped in a list of their own.
+        return sections if self.children else [sections]
+
+    def _collect_sections(
+            self,
+            out: list,
+    ) -> None:
+        fields = [{'pages': self._pages}, {'type': self.type},
+                  {'title': self._title}, {'text': self.text}]
+        out.extend(fields)
+        for child in self.children.values():
+            if child.children:
+                child._collect_sections(out)
+            else:
+                leaf = []
+                child._collect_sections(leaf)
+                out.append(leaf)
     
     @property
     def title(self) -> str | None:
-        if len(self.children) == 0:
-            return None
-        
-        for _, child in self.children.items():
-            if child.type == 'Title':
-                return child.text
-            elif child.type.startswith('H'):
-                return child.text
-            else:
-                if child.title != None:
-                    return child.title
-        
-        return None
+        if self._pages is None:
+            self.finalize()
+        return self._title
 
 
 def extract_to_tree(
@@ -89,7 +140,7 @@ def extract_to_tree(
         cur.children[(type, num)] = \
             Node(page=element.get('Page', None), type=type, text=element.get('Text', ''))
     
-    return root
+    return root.finalize()
 
 def extract_to_tree_v2(
         extract: list[dict]
@@ -209,12 +260,12 @@ def extract_to_tree_v3(
             type, num = part_to_tuple(current_section_split[-1])
             cur.children[(type, num)] = Node(page=element['Page'], type=type, text=element['Text'])
     
-    return root
+    return root.finalize()
 
 ########################
 
 def extract_to_tree_v4(
-        extract: list[dict]
+        extract: Iterable[dict]
 ) -> tuple: 
 
     #print("Extract")
@@ -226,6 +277,12 @@ def extract_to_tree_v4(
     section_to_figures = {}
     section_to_tables = {}
 
+    # Text is collected in per-section/per-page lists and joined once at the
+    # end; repeated `str + " " + str` is quadratic in the length of a section.
+    section_to_texts = {}
+    section_to_pages = {}
+    page_to_texts = {}
+
     for element in extract:
 
         current_path = element['Path'].replace("//Document/","")
@@ -234,11 +291,12 @@ def extract_to_tree_v4(
 
         if "Text" in element and "Page" in element:
             
-            if current_section not in section_to_metadata:
-                section_to_metadata[current_section] = {"title": "", "pages": [], "text": "", "header_type": ""}
-                current_metadata = section_to_metadata[current_section]
-            else:
-                current_metadata = section_to_metadata[current_section]
+            current_metadata = section_to_metadata.get(current_section)
+            if current_metadata is None:
+                current_metadata = {"title": "", "pages": [], "text": "", "header_type": ""}
+                section_to_metadata[current_section] = current_metadata
+                section_to_texts[current_section] = []
+                section_to_pages[current_section] = set()
             
             if "Title" in current_path:
                 current_metadata['title'] = element['Text']
@@ -250,19 +308,20 @@ def extract_to_tree_v4(
                 current_metadata['title'] = element['Text']
                 current_metadata['header_type'] = "H2"
             else:
-                current_metadata['text'] = current_metadata['text'] + " " + element['Text']
+                section_to_texts[current_section].append(element['Text'])
 
-            if element['Page'] + 1 not in current_metadata['pages']:
-                current_metadata['pages'].append(element['Page'] + 1)
-            
-            section_to_metadata[current_section] = current_metadata
+            page = element['Page'] + 1
+            current_pages = section_to_pages[current_section]
+            if page not in current_pages:
+                current_pages.add(page)
+                current_metadata['pages'].append(page)
 
             ####################
 
-            if element['Page'] + 1 in page_to_text:
-                page_to_text[element['Page'] + 1] = page_to_text[element['Page'] + 1] + " " + element['Text']
+            if page in page_to_texts:
+                page_to_texts[page].append(element['Text'])
             else:
-                page_to_text[element['Page'] + 1] = element['Text']
+                page_to_texts[page] = [element['Text']]
 
         # if "Figure" in current_path:
         #     if current_section not in section_to_figures:
@@ -287,6 +346,12 @@ def extract_to_tree_v4(
 
     ############################
 
+    # Section text has always started with a separator, page text has not.
+    for section, texts in section_to_texts.items():
+        section_to_metadata[section]['text'] = " " + " ".join(texts) if texts else ""
+    for page, texts in page_to_texts.items():
+        page_to_text[page] = " ".join(texts)
+
     return section_to_metadata, page_to_text, section_to_figures, section_to_tables
 
 
@@ -294,16 +359,156 @@ def extract_to_tree_v4(
 
 ########################
 
+class _JSONStream:
+    """
+    Minimal pull parser over a text file: decodes one JSON value at a time
+    with `raw_decode`, reading more of the file only when a value runs past
+    the end of the buffer.
+    """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(
+            self,
+            fp: TextIO,
+            chunk_size: int,
+            offset: int = 0,
+    ) -> None:
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        # File byte offset of buffer[_mark], for tell(); `offset` is where
+        # fp starts in the file.
+        self._mark = 0
+        self._mark_offset = offset
+
+    def _fill(self, size: int | None = None) -> bool:
+        chunk = self.fp.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self._mark_offset += len(self.buffer[self._mark:self.pos].encode("utf-8"))
+        self._mark = 0
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def tell(self) -> int:
+        """
+        Byte offset in the (UTF-8) file of the next unread character.
+        """
+        self._mark_offset += len(self.buffer[self._mark:self.pos].encode("utf-8"))
+        self._mark = self.pos
+        return self._mark_offset
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\n\r":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of Extract JSON")
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos} of the Extract JSON buffer")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill(size):
+                    raise
+                # Grow the reads so a single huge element isn't re-decoded
+                # once per chunk.
+                size *= 2
+                continue
+            # A number (or anything else) ending exactly at the buffer edge
+            # may continue in the next chunk.
+            if end == len(self.buffer) and not self.eof and self._fill(size):
+                continue
+            self.pos = end
+            return value
+
+
+def iter_extract_elements(
+        extract_path: Path,
+        chunk_size: int = 1 << 16,
+) -> Iterator[dict]:
+    """
+    Yields the entries of the top-level `elements` array of an Extract JSON
+    file one at a time, without decoding the whole document. Other top-level
+    keys are parsed and discarded.
+    """
+    return (element for _, element in scan_extract_elements(extract_path, chunk_size=chunk_size))
+
+
+def scan_extract_elements(
+        extract_path: Path,
+        offset: int | None = None,
+        chunk_size: int = 1 << 16,
+) -> Iterator[tuple[int, Any]]:
+    """
+    Yields (byte offset, element) for the entries of the top-level
+    `elements` array, decoding one at a time; other top-level keys are parsed
+    and discarded. Given the offset of an element from an earlier scan,
+    starts reading there instead of at the top of the file.
+    """
+    with open(extract_path, "rb") as raw:
+        if offset is not None:
+            raw.seek(offset)
+        stream = _JSONStream(io.TextIOWrapper(raw, encoding="utf-8", newline=""), chunk_size, offset or 0)
+
+        if offset is None:
+            stream.expect('{')
+            if stream.peek() == '}':
+                return
+            while True:
+                key = stream.value()
+                stream.expect(':')
+                if key == 'elements':
+                    stream.expect('[')
+                    if stream.peek() == ']':
+                        return
+                    break
+                stream.value()
+                if stream.peek() == '}':
+                    return
+                stream.expect(',')
+
+        while True:
+            stream.peek()
+            yield stream.tell(), stream.value()
+            if stream.peek() == ']':
+                return
+            stream.expect(',')
+
+
 #@click.command()
 #@click.argument("extract_path", type=Path)
 def extract_metadata(
-        extract_path: Path
+        extract_path: Path,
+        stream: bool = False,
 ):
-    #with extract_path.open() as fp:
-    with open(extract_path) as fp:
-        extract = json.load(fp)
-
-    tree, page_to_text, section_to_figures, section_to_tables = extract_to_tree_v4(extract['elements'])
+    """
+    With `stream=True` the Extract elements are read incrementally from the
+    file, so peak memory no longer includes the decoded Extract document.
+    """
+    if stream:
+        elements = iter_extract_elements(extract_path)
+    else:
+        #with extract_path.open() as fp:
+        with open(extract_path) as fp:
+            elements = json.load(fp)['elements']
+
+    tree, page_to_text, section_to_figures, section_to_tables = extract_to_tree_v4(elements)
     
     metadata = {"pages": [],
                 "sections": []}#,
@@ -337,19 +542,158 @@ def extract_metadata(
     #print(metadata)
     #return metadata
 
-if __name__ == '__main__':
+########################
 
-    from os import listdir
-    from os.path import isfile, join
-    import json
-    folder_path = "data/valid_json/"
-    metadata_path = "data/valid_metadata/"
-    valid_jsons = [f for f in listdir(folder_path) if isfile(join(folder_path, f))]
-    #str_path = "Archive/fetched/1/DR--1079341.json"
-    #valid_jsons = ['DR--1058108.json']
-    for json_file in valid_jsons:
-        testing_file_path = Path(folder_path + json_file)
-        print(testing_file_path)
-        current_metadata = extract_metadata(testing_file_path)
-        with open(metadata_path + json_file.replace(".json", "-metadata.json"), 'w') as f:
-            json.dump(current_metadata, f, indent=2)
+MANIFEST_NAME = ".manifest.json"
+
+
+def file_digest(
+        path: Path
+) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(
+        path: Path,
+        data: Any,
+        **kwargs,
+) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp_path, path)
+
+
+def _extract_one(
+        extract_path: Path,
+        output_path: Path,
+        previous_digest: str | None,
+        stream: bool,
+        bm25: bool,
+        binary: bool,
+) -> dict[str, Any]:
+    """
+    Worker for `batch`. Hashing happens here rather than in the parent so
+    files whose mtime changed but whose content didn't are cheap to skip.
+    """
+    start = time.perf_counter()
+    digest = file_digest(extract_path)
+    if digest == previous_digest and output_path.exists():
+        return {"sha256": digest, "skipped": True, "seconds": time.perf_counter() - start}
+
+    metadata = extract_metadata(extract_path, stream=stream)
+    _write_json_atomic(output_path, metadata, indent=2)
+    # The sidecars are written after the metadata so load_tree sees them as
+    # up to date.
+    if binary:
+        write_document(binary_path_for(output_path), metadata)
+    if bm25:
+        BM25Index.build(metadata['pages']).save(index_path_for(output_path))
+    return {"sha256": digest, "skipped": False, "seconds": time.perf_counter() - start}
+
+
+@click.command()
+@click.option("--input-dir", type=Path, default="data/valid_json/", show_default=True)
+@click.option("--output-dir", type=Path, default="data/valid_metadata/", show_default=True)
+@click.option("--manifest", "manifest_path", type=Path, default=None,
+              help=f"Defaults to OUTPUT_DIR/{MANIFEST_NAME}.")
+@click.option("--workers", type=int, default=os.cpu_count(), show_default=True)
+@click.option("--stream/--no-stream", default=True, show_default=True,
+              help="Parse the Extract JSON incrementally.")
+@click.option("--bm25/--no-bm25", default=True, show_default=True,
+              help="Also write a BM25 page index next to each -metadata.json.")
+@click.option("--binary/--no-binary", default=True, show_default=True,
+              help="Also write the lazily loaded -metadata.bin format next to each -metadata.json.")
+@click.option("--force", is_flag=True, help="Re-extract every file, ignoring the manifest.")
+def batch(
+        input_dir: Path,
+        output_dir: Path,
+        manifest_path: Path | None,
+        workers: int,
+        stream: bool,
+        bm25: bool,
+        binary: bool,
+        force: bool,
+):
+    """
+    Extracts metadata for every Extract JSON in INPUT_DIR across a process
+    pool. A manifest of input size/mtime/sha256 is kept next to the outputs,
+    so files that haven't changed since the last run are skipped without
+    being opened. Failures are reported at the end instead of stopping the run.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = manifest_path or output_dir / MANIFEST_NAME
+    manifest = {}
+    if manifest_path.exists() and not force:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    start = time.perf_counter()
+    pending = {}
+    skipped = 0
+    for entry in os.scandir(input_dir):
+        if not entry.is_file() or not entry.name.endswith(".json"):
+            continue
+        stat = entry.stat()
+        output_path = output_dir / entry.name.replace(".json", "-metadata.json")
+        previous = manifest.get(entry.name)
+
+        if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns \
+                and output_path.exists():
+            skipped += 1
+            continue
+        pending[entry.name] = (Path(entry.path), output_path, stat, previous)
+
+    print(f"{len(pending)} to extract, {skipped} unchanged")
+
+    failures = {}
+    extracted = 0
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_extract_one, extract_path, output_path, (previous or {}).get("sha256"), stream, bm25, binary): name
+            for name, (extract_path, output_path, _, previous) in pending.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            _, output_path, stat, _ = pending[name]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures[name] = f"{type(e).__name__}: {e}"
+                print(f"FAILED {name}: {failures[name]}")
+                continue
+
+            if result["skipped"]:
+                skipped += 1
+            else:
+                extracted += 1
+            print(f"{'unchanged' if result['skipped'] else 'extracted'} {name} in {result['seconds']:.2f}s")
+            manifest[name] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": result["sha256"],
+                "output": output_path.name,
+                "seconds": round(result["seconds"], 4),
+            }
+            done += 1
+            # Checkpoint so an interrupted run doesn't lose its progress.
+            if done % 500 == 0:
+                _write_json_atomic(manifest_path, manifest)
+
+    _write_json_atomic(manifest_path, manifest)
+
+    print(f"Done in {time.perf_counter() - start:.2f}s: {extracted} extracted, {skipped} unchanged, "
+          f"{len(failures)} failed")
+    for name, error in sorted(failures.items()):
+        print(f"  {name}: {error}")
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    batch()
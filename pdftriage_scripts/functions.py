@@ -1,14 +1,39 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from chunking import Chunk, iter_chunks, token_windows
+from doc_store import binary_path_for, open_document
+from document_cache import freeze, get_document_cache, resident_bytes
 from extract_metadata import extract_to_tree, Node
+from completion_cache import get_completion_cache
+from embedding_backends import OpenAIEmbeddingBackend, get_embedding_backend
+from lazy_extract import LazyExtract
+from lexical_index import BM25Index, index_path_for
+from metadata_packing import context_window, count_tokens, pack_metadata, truncate_tokens
+from page_store import PageStore
+from rank_fusion import reciprocal_rank_fusion
+from rate_limit import estimate_request_tokens, get_rate_limiter
+from section_index import SectionIndex
+from typing import Any
 
 import numpy
 import openai
 import json
+import os
+import time
 
 
 #############################
 
+QA_MODEL = "gpt-3.5-turbo-16k"
+ANSWER_TOKENS = 1024
+MAX_TOOL_STEPS = 4
+MAX_TOOL_TOKENS = 48_000
+MIN_TOOL_RESULT_TOKENS = 256
+TOOL_RESULT_TOKENS = 4096
+SEARCH_BACKEND = os.environ.get("PDFTRIAGE_SEARCH_BACKEND", "embedding")
+HYBRID_CANDIDATES = 20
+
 functions = [
     {
         "name": "fetch_pages",
@@ -19,9 +44,9 @@ functions = [
                 "pages": {
                     "type": "array",
                     "items": {
-                        "type": "number"
+                        "type": ["number", "string"]
                     },
-                    "description": "The list of pages to fetch."
+                    "description": "The list of pages to fetch. Ranges such as \"10-40\" are allowed."
                 }
             },
             "required": ["pages"]
@@ -58,15 +83,19 @@ functions = [
 ]
 
 
+tools = [{"type": "function", "function": function} for function in functions]
+
+
 def fetch_pages(
         tree: dict,
         pages: list[int],
 ) -> str:
-    
-    content = ""
-    for key in tree['pages'].keys():
-        if key in pages:
-            content += tree['pages'][key] + "\n"
+    """
+    Text of the requested pages, in document order. Page numbers may be
+    ints, floats or strings, and strings may be ranges such as "10-40".
+    """
+    store = derived(tree, "pages", lambda t: PageStore.from_pages(t['pages']))
+    content = "\n".join(text for _, text in store.fetch(pages))
     
     #content = (" ").join(content.strip().split(" ")[:1])
     content = content.strip()
@@ -78,15 +107,14 @@ def fetch_section(
         extract: dict,
         section: str,
 ) -> str:
+    """
+    Text of the section titled `section`, matched exactly, after
+    normalization, or fuzzily (see section_index.SectionIndex).
+    """
+    index = derived(tree, "sections", lambda t: SectionIndex(t['sections']))
 
-    content = ""
-    for section in tree['sections']:
-        if section == section['title']:
-            content = content + " " + section['text']
-    
     #content = (" ").join(content.strip().split(" ")[:1])
-    content = content.strip()
-    return content
+    return index.text(section)
 
 def fetch_all(
         json_uploaded: dict
@@ -98,26 +126,65 @@ def fetch_all(
     return content.strip()
 
 class VectorStore:
-    
+    """
+    Cosine-similarity index over a contiguous, row-normalized float32 matrix.
+    """
+
     def __init__(
             self,
-            vectors: list[list[float]] | list[numpy.array]
+            vectors: list[list[float]] | list[numpy.array] | numpy.ndarray
     ) -> None:
-        self.vectors = numpy.array(vectors)
-    
-    
+        self.vectors = _normalize_rows(numpy.asarray(vectors, dtype=numpy.float32))
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
     def neighbors(
             self,
             query: list[float] | numpy.array,
             k: int
-    ) -> list[int]:
-        query = numpy.array(query)
-        similarities = numpy.dot(self.vectors, query.T)
-        document_similarities = sorted([
-            (similarity, ix) for ix, similarity in enumerate(similarities)
-        ], reverse=True, key=lambda t: t[0])
+    ) -> list[tuple[float, int]]:
+        return self.neighbors_batch([query], k)[0]
+
+    def neighbors_batch(
+            self,
+            queries: list[list[float]] | numpy.ndarray,
+            k: int
+    ) -> list[list[tuple[float, int]]]:
+        """
+        Scores every query against the store with a single matrix multiply and
+        returns, per query, the top `k` (similarity, ix) pairs, best first.
+        """
+        queries = _normalize_rows(numpy.atleast_2d(numpy.asarray(queries, dtype=numpy.float32)))
+        k = min(k, len(self))
+        if k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        similarities = queries @ self.vectors.T
+        if k < len(self):
+            top = numpy.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            top = numpy.broadcast_to(numpy.arange(len(self)), (queries.shape[0], k))
+        top_similarities = numpy.take_along_axis(similarities, top, axis=1)
+        order = numpy.argsort(-top_similarities, axis=1, kind="stable")
+        top = numpy.take_along_axis(top, order, axis=1)
+        top_similarities = numpy.take_along_axis(top_similarities, order, axis=1)
+
+        return [
+            list(zip(row_similarities.tolist(), row_ixs.tolist()))
+            for row_similarities, row_ixs in zip(top_similarities, top)
+        ]
 
-        return document_similarities[:k]
+
+def _normalize_rows(
+        matrix: numpy.ndarray
+) -> numpy.ndarray:
+    matrix = numpy.ascontiguousarray(matrix, dtype=numpy.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1) if matrix.size else matrix.reshape(0, 0)
+    norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
 
 
 def embed(
@@ -126,39 +193,158 @@ def embed(
 ) -> numpy.ndarray:
     """
     We're going to use the OpenAI API to embed the texts for retrieval.
+
+    Retrieval itself embeds through the configured backend (see
+    embedding_backends), which is this one unless set otherwise.
     """
-    embedding = openai.Embedding.create(
-        input=text,
-        model=model
-    )
+    return OpenAIEmbeddingBackend(model).embed(text)
 
-    return [numpy.array(data['embedding']) for data in embedding['data']]
+
+def derived(
+        tree: dict,
+        name: str,
+        build,
+):
+    """
+    Per-document memo for structures built from a loaded tree (indexes,
+    chunks, vector stores). They live on the tree's document cache entry, so
+    they count against its budget and are evicted with the tree.
+    """
+    return get_document_cache().derived(tree, name, build)
+
+
+def set_derived(
+        tree: dict,
+        name: str,
+        value,
+) -> None:
+    get_document_cache().set_derived(tree, name, value)
 
 
 def search(
         tree: Node,
         extract: list[dict],
         query: str,
+        backend: str | None = None,
 ) -> str:
-    long_document = []
-    page_ids = []
+    """
+    Returns the text of the pages that best match `query`. See `retrieve`
+    for the backends; the default comes from $PDFTRIAGE_SEARCH_BACKEND.
+    """
+    backend = backend or SEARCH_BACKEND
+    page_ids, texts = document_pages(tree)
+    lexical_index, vector_store = page_indexes(tree, backend)
 
-    for page in tree['pages']:
-        page_content = fetch_pages(tree, [page])
-        if not page_content.strip(): continue
-        page_ids.append(page)
-        long_document.append(page_content)
+    hits = retrieve(query, page_ids, texts, 4, backend, lexical_index, vector_store)
+    neighbors = sorted(hit["id"] for hit in hits)
+
+    return fetch_pages(tree, neighbors)
 
-    doc_embeddings = embed(long_document)
 
-    query_embedding = embed([query])[0]
+def document_pages(
+        tree: dict,
+) -> tuple[list, list[str]]:
+    """
+    (page ids, texts) of the non-empty pages of `tree`, for page retrieval.
+    """
+    def build(t):
+        pages = [(page, fetch_pages(t, [page])) for page in t['pages']]
+        pages = [(page, text) for page, text in pages if text.strip()]
+        return [page for page, _ in pages], [text for _, text in pages]
 
-    v = VectorStore(doc_embeddings)
+    return derived(tree, "page_texts", build)
 
-    neighbors = v.neighbors(query_embedding, k=4)
-    neighbors = sorted([page_ids[n] for _, n in neighbors])
 
-    return fetch_pages(tree, neighbors)
+def page_indexes(
+        tree: dict,
+        backend: str,
+) -> tuple[BM25Index | None, VectorStore | None]:
+    """
+    The page-level lexical index and vector store `backend` needs, built
+    once per document like the chunk indexes.
+    """
+    lexical_index = vector_store = None
+    if backend in ("bm25", "hybrid"):
+        lexical_index = derived(tree, "bm25", lambda t: BM25Index.build(t['pages']))
+    if backend in ("embedding", "hybrid"):
+        _, texts = document_pages(tree)
+        embedder = get_embedding_backend()
+        vector_store = derived(tree, f"page_vectors:{embedder.name}", lambda t: VectorStore(embedder.embed(texts)))
+    return lexical_index, vector_store
+
+
+def dense_rank(
+        query: str,
+        ids: list,
+        texts: list[str],
+        k: int,
+        vector_store: VectorStore | None = None,
+) -> list[tuple[float, Any]]:
+    if not texts:
+        return []
+
+    backend = get_embedding_backend()
+    query_embedding = backend.embed([query])[0]
+
+    v = vector_store if vector_store is not None else VectorStore(backend.embed(texts))
+
+    return [(similarity, ids[ix]) for similarity, ix in v.neighbors(query_embedding, k=k)]
+
+
+def retrieve(
+        query: str,
+        ids: list,
+        texts: list[str],
+        k: int = 4,
+        backend: str | None = None,
+        lexical_index: BM25Index | None = None,
+        vector_store: VectorStore | None = None,
+) -> list[dict]:
+    """
+    Top `k` of `texts` for `query` as [{"id": ..., "score": ..., ...}], best
+    first. Backends:
+
+    - "embedding": cosine similarity over API embeddings
+    - "bm25": the local lexical index
+    - "hybrid": both, run in parallel and merged with reciprocal-rank fusion;
+      results carry each source's score and rank (lexical_*/dense_*)
+
+    `lexical_index` is built over `texts` when not given, and must use
+    str(id) as its document ids. Likewise `vector_store`, if given, must hold
+    the embeddings of `texts` in order.
+    """
+    backend = backend or SEARCH_BACKEND
+    if backend not in ("embedding", "bm25", "hybrid"):
+        raise ValueError(f"Unknown search backend {backend!r}")
+
+    if backend == "embedding":
+        return [
+            {"id": id, "score": similarity, "dense_score": similarity, "dense_rank": rank}
+            for rank, (similarity, id) in enumerate(dense_rank(query, ids, texts, k, vector_store), start=1)
+        ]
+
+    # The lexical index only knows string ids; map them back to the caller's.
+    by_key = {str(id): id for id in ids}
+    if lexical_index is None:
+        lexical_index = BM25Index.build(dict(zip(by_key, texts)))
+
+    def lexical_rank(limit: int) -> list[tuple[float, Any]]:
+        return [
+            (score, by_key[key]) for score, key in lexical_index.search(query, limit) if key in by_key
+        ]
+
+    if backend == "bm25":
+        return [
+            {"id": id, "score": score, "lexical_score": score, "lexical_rank": rank}
+            for rank, (score, id) in enumerate(lexical_rank(k), start=1)
+        ]
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        lexical = pool.submit(lexical_rank, HYBRID_CANDIDATES)
+        dense = pool.submit(dense_rank, query, ids, texts, HYBRID_CANDIDATES, vector_store)
+        rankings = {"lexical": lexical.result(), "dense": dense.result()}
+
+    return reciprocal_rank_fusion(rankings, k)
 
 
 def execute_function_call(
@@ -166,10 +352,24 @@ def execute_function_call(
         extract,
         tree,
 ) -> tuple[str, dict[str, str]]:
-    arguments = json.loads(message["function_call"]["arguments"])
+    return execute_tool_call(
+        message["function_call"]["name"], message["function_call"]["arguments"], extract, tree
+    )
+
+
+def execute_tool_call(
+        name: str,
+        arguments: str,
+        extract,
+        tree,
+) -> tuple[str, dict[str, str]]:
+    try:
+        arguments = json.loads(arguments)
+    except json.JSONDecodeError:
+        return f"Error: arguments for {name} are not valid JSON", { "verb": "failing", "noun": name }
     action = {}
 
-    if message["function_call"]["name"] == "fetch_pages":
+    if name == "fetch_pages":
         pages = arguments["pages"]
         content = fetch_pages(tree, pages)
         if len(pages) == 1:
@@ -178,36 +378,131 @@ def execute_function_call(
             noun = "pages " + " ".join(str(p) for p in pages)
 
         action = { "verb": "fetching", "noun": noun }
-    elif message["function_call"]["name"] == "fetch_section":
+    elif name == "fetch_section":
         action = { "verb": "fetching", "noun": arguments["section_title"] }
         content = fetch_section(tree, extract, arguments["section_title"])
-    elif message["function_call"]["name"] == "search":
+    elif name == "search":
         action = { "verb": "searching", "noun": arguments["query"] }
         content = search(tree, extract, arguments["query"])
     else:
-        content = f"Error: function {message['function_call']['name']} does not exist"
+        content = f"Error: function {name} does not exist"
     return content, action
 
 
-def load_extract(
-        document: str
+def _tool_calls(
+        message: dict
 ) -> list[dict]:
-    extract_path = Path(document)
+    """
+    Normalizes parallel `tool_calls` and legacy single `function_call`
+    replies to a list of {id, name, arguments}.
+    """
+    if message.get("tool_calls"):
+        return [
+            {"id": call["id"], "name": call["function"]["name"], "arguments": call["function"]["arguments"]}
+            for call in message["tool_calls"]
+        ]
+    if message.get("function_call"):
+        call = message["function_call"]
+        return [{"id": None, "name": call["name"], "arguments": call["arguments"]}]
+    return []
+
+
+def run_tool_calls(
+        calls: list[dict],
+        extract,
+        tree,
+        max_result_tokens: int | None = None,
+) -> list[tuple[str, dict]]:
+    """
+    Executes one turn's tool calls concurrently and returns (content, action)
+    per call, in order. Each action records how long its call took.
+    """
+    def run(call: dict) -> tuple[str, dict]:
+        start = time.perf_counter()
+        try:
+            content, action = execute_tool_call(call["name"], call["arguments"], extract, tree)
+            if max_result_tokens is not None:
+                content = truncate_tokens(content, max_result_tokens, QA_MODEL)
+        except Exception as e:
+            content, action = f"Error: {call['name']} failed: {e}", { "verb": "failing", "noun": call["name"] }
+        action["seconds"] = round(time.perf_counter() - start, 4)
+        return content, action
+
+    if len(calls) == 1:
+        return [run(calls[0])]
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        return list(pool.map(run, calls))
+
+
+def chat_completion(
+        **request
+) -> dict:
+    """
+    Single entry point for chat-completion calls. Requests go through the
+    record/replay completion cache, and only the ones that actually reach the
+    API are counted against the process-wide rate limiter.
+    """
+    return get_completion_cache().complete(request, _create_chat_completion)
+
+
+def _create_chat_completion(
+        **request
+) -> dict:
+    limiter = get_rate_limiter()
+    if limiter is not None:
+        limiter.acquire(estimate_request_tokens(request))
 
-    with extract_path.open() as f_extract:
-        extract = json.load(f_extract)
+    return openai.ChatCompletion.create(**request)
 
-    return extract['elements']
+
+def load_extract(
+        document: str
+) -> LazyExtract:
+    """
+    A lazy handle on the document's extract elements. The file isn't read
+    until an element is accessed; see lazy_extract.
+    """
+    return LazyExtract(document)
 
 def load_tree(
         document: str
-) -> list[dict]:
+) -> dict:
+    """
+    Loads a document's metadata through the process-wide document cache. If an
+    up-to-date -metadata.bin written by extract_metadata sits next to the JSON
+    (or `document` is one), a lazy memory-mapped view is returned instead,
+    which decodes only the pages and sections that are actually read. JSON
+    trees are returned frozen.
+    """
     tree_path = Path(document)
+    binary_path = binary_path_for(tree_path)
+
+    if tree_path.suffix == ".bin" or (
+            binary_path.exists() and (not tree_path.exists() or
+                                      binary_path.stat().st_mtime >= tree_path.stat().st_mtime)):
+        return get_document_cache().get("tree", binary_path, _read_tree)
+    return get_document_cache().get("tree", tree_path, _read_tree)
+
+def _read_tree(
+        path: Path
+) -> tuple[Any, int, dict]:
+    derived = {}
+    if path.suffix == ".bin":
+        tree = open_document(path)
+        derived["pages"] = tree.page_store
+        size = tree.index_bytes
+    else:
+        with path.open() as f_tree:
+            tree = freeze(json.load(f_tree))
+        size = resident_bytes(tree)
 
-    with tree_path.open() as f_tree:
-        tree = json.load(f_tree)
+    # Pick up the BM25 index written next to the metadata by extract_metadata,
+    # unless the metadata has been rewritten since.
+    index_path = index_path_for(path)
+    if index_path.exists() and index_path.stat().st_mtime >= path.stat().st_mtime:
+        derived["bm25"] = BM25Index.load(index_path)
 
-    return tree
+    return tree, size, derived
 
 def ask_question(
         question: str,
@@ -219,17 +514,28 @@ def ask_question(
     tree = load_tree(tree_path)
     actions = []
 
-    metadata = {
-        'pages': tree['pages'],
-        'sections': tree['sections']
-    }
+    system_prompt = """
+You are an expert document question answering system. You answer questions by finding relevant content in the document and answering questions based on that content. You can summarize the document by fetching the first several pages. Document metadata: {metadata}
+""".strip()
+
+    # Whatever is left of the window after the prompt, the question, the
+    # function schemas and room for tool results and the answer goes to the
+    # metadata.
+    budget = context_window(QA_MODEL) - ANSWER_TOKENS - TOOL_RESULT_TOKENS - count_tokens(
+        system_prompt.format(metadata="") + question + json.dumps(tools), QA_MODEL
+    )
+    packed = pack_metadata(tree, budget, QA_MODEL)
+    actions.append({
+        "verb": "packing",
+        "noun": f"{packed.level} metadata ({packed.tokens} tokens)",
+        "level": packed.level,
+        "tokens": packed.tokens,
+    })
 
     messages = [
         {
             'role': 'system',
-            'content': f"""
-You are an expert document question answering system. You answer questions by finding relevant content in the document and answering questions based on that content. You can summarize the document by fetching the first several pages. Document metadata: {json.dumps(metadata)}
-""".strip()
+            'content': system_prompt.format(metadata=packed.text)
         },
         {
             'role': 'user',
@@ -237,53 +543,64 @@ You are an expert document question answering system. You answer questions by fi
         }
     ]
 
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo-16k", #"gpt-3.5-turbo-0613",
+    # Let the model call tools, several at a time if it wants, until it
+    # answers or runs out of steps or tokens.
+    tokens_used = 0
+    for step in range(MAX_TOOL_STEPS):
+        start = time.perf_counter()
+        response = chat_completion(
+            model=QA_MODEL, #"gpt-3.5-turbo-0613",
             messages=messages,
-            functions=functions,
-            function_call="auto",
+            tools=tools,
+            tool_choice="auto",
         )
-    except:
-        
-        for key in tree['pages']:
-            tree['pages'][key] = (" ").join(tree['pages'][key].split(" ")[:256])
-        for i in range(0, len(tree['sections'])):
-            tree['sections'][i]["text"] = (" ").join(tree['sections'][i]["text"].split(" ")[:256])
-        
-        messages = [
-            {
-                'role': 'system',
-                'content': f"""
-    You are an expert document question answering system. You answer questions by finding relevant content in the document and answering questions based on that content. You can summarize the document by fetching the first several pages. Document metadata: {json.dumps(metadata)}
-    """.strip()
-            },
-            {
-                'role': 'user',
-                'content': question
-            }
-        ]
-
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo-16k", #"gpt-3.5-turbo-0613",
-            messages=messages,
-            functions=functions,
-            function_call="auto",
+        usage = response.get("usage") or {}
+        tokens_used += usage.get("total_tokens", 0)
+        actions.append({
+            "verb": "asking",
+            "noun": QA_MODEL,
+            "step": step,
+            "seconds": round(time.perf_counter() - start, 4),
+            "tokens": usage.get("total_tokens", 0),
+        })
+
+        assistant_message = response["choices"][0]["message"]
+        calls = _tool_calls(assistant_message)
+        if not calls:
+            return assistant_message["content"], actions
+
+        # Split what is left of the window between this turn's results. If
+        # that's too little to be useful, answer with what has been fetched:
+        # the calls are dropped, since every call needs a result message.
+        context_tokens = usage.get("total_tokens") or count_tokens(
+            json.dumps(messages + [assistant_message]) + json.dumps(tools), QA_MODEL
         )
+        remaining = context_window(QA_MODEL) - ANSWER_TOKENS - context_tokens
+        if remaining < MIN_TOOL_RESULT_TOKENS * len(calls):
+            actions.append({"verb": "stopping", "noun": f"tool calls ({remaining} tokens left)", "step": step})
+            break
+        messages.append(assistant_message)
+        max_result_tokens = remaining // len(calls)
+        results = run_tool_calls(calls, extract, tree, max_result_tokens)
+
+        for call, (content, action) in zip(calls, results):
+            action["step"] = step
+            actions.append(action)
+            if call["id"] is None:
+                messages.append({"role": "function", "name": call["name"], "content": content})
+            else:
+                messages.append({"role": "tool", "tool_call_id": call["id"], "content": content})
+
+        if tokens_used >= MAX_TOOL_TOKENS:
+            break
 
     ######################################################################################################
 
-    assistant_message = response["choices"][0]["message"]
-    messages.append(assistant_message)
-
-    if assistant_message.get("function_call"):
-        results, action = execute_function_call(assistant_message, extract, tree)
-        actions.append(action)
-        messages.append({"role": "function", "name": assistant_message["function_call"]["name"], "content": results})
-
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo-16k", #"gpt-3.5-turbo-16k",
+    response = chat_completion(
+        model=QA_MODEL, #"gpt-3.5-turbo-16k",
         messages=messages,
+        tools=tools,
+        tool_choice="none",
     )
 
     return response["choices"][0]["message"]["content"], actions
@@ -296,15 +613,9 @@ You are an expert document question answering system. You answer questions by fi
 
 ##################################################
 
-import tiktoken
-
 def truncate(input_text, max_token_limit, model_name="gpt-3.5-turbo"):
-
-    
-    encoder = tiktoken.encoding_for_model(model_name)
-    encoded_text = encoder.encode(input_text)[:max_token_limit]
-    decoded_text = encoder.decode(encoded_text)
-    return decoded_text
+    # Through metadata_packing so the offline word-token fallback applies.
+    return truncate_tokens(input_text, max_token_limit, model_name)
 
 def ask_question_truncation(
         question: str,
@@ -335,7 +646,7 @@ You are an expert document question answering system. You answer questions by fi
         }
     ]
 
-    response = openai.ChatCompletion.create(
+    response = chat_completion(
             model="gpt-3.5-turbo", #"gpt-3.5-turbo-0613",
             messages=messages,
             #functions=functions,
@@ -346,7 +657,13 @@ You are an expert document question answering system. You answer questions by fi
 
 ######################################################################################################
 
-def perform_retrieval(question: str, documents: list[str]):
+def perform_retrieval(
+        question: str,
+        documents: list[str],
+        backend: str | None = None,
+        lexical_index: BM25Index | None = None,
+        vector_store: VectorStore | None = None,
+):
     
     page_ids = []
     long_documents = []
@@ -355,14 +672,10 @@ def perform_retrieval(question: str, documents: list[str]):
         page_ids.append(i)
         long_documents.append(document)
 
-    doc_embeddings = embed(long_documents)
-
-    query_embedding = embed([question])[0]
-
-    v = VectorStore(doc_embeddings)
-
-    neighbors = v.neighbors(query_embedding, k=4)
-    neighbors = sorted([page_ids[n] for _, n in neighbors])
+    hits = retrieve(question, page_ids, long_documents, 4, backend, lexical_index, vector_store)
+    neighbors = sorted([hit["id"] for hit in hits])
+    if not neighbors:
+        return ""
     
     #print("neighbors")
     #print(len(documents))
@@ -384,11 +697,14 @@ def ask_question_retrieval_pages(
     tree = load_tree(tree_path)
     actions = []
 
-    pages = []
-    for key in tree['pages'].keys():
-        pages.append(tree['pages'][key])
-
-    context = perform_retrieval(question, pages)
+    # The page indexes are built once per document, as for chunks. As before,
+    # the earliest of the retrieved pages is the context.
+    backend = SEARCH_BACKEND
+    page_ids, texts = document_pages(tree)
+    lexical_index, vector_store = page_indexes(tree, backend)
+    hits = retrieve(question, page_ids, texts, 4, backend, lexical_index, vector_store)
+    first = min((page_ids.index(hit["id"]) for hit in hits), default=None)
+    context = texts[first] if first is not None else ""
 
     messages = [
         {
@@ -403,7 +719,7 @@ You are an expert document question answering system. You answer questions by fi
         }
     ]
 
-    response = openai.ChatCompletion.create(
+    response = chat_completion(
             model="gpt-3.5-turbo", #"gpt-3.5-turbo-0613",
             messages=messages,
             #functions=functions,
@@ -414,13 +730,17 @@ You are an expert document question answering system. You answer questions by fi
 
 ######################################################################################################
 
-import re
-
 def divide_into_chunks(text, chunk_size=100):
-    words = re.findall(r'\b\w+\b', text)
-    chunks = [words[i:i + chunk_size] for i in range(0, len(words), chunk_size)]
-    chunked_texts = [' '.join(chunk) for chunk in chunks]
-    return chunked_texts
+    """
+    Token windows of `chunk_size` tokens over `text`, without overlap. Kept
+    for callers outside the tree-based path; see chunking.iter_chunks.
+    """
+    return [window for window, _ in token_windows(text, chunk_size, 0)]
+
+def document_chunks(
+        tree: dict,
+) -> list[Chunk]:
+    return derived(tree, "chunks", lambda t: list(iter_chunks(t)))
 
 def ask_question_retrieval_chunks(
         question: str,
@@ -432,12 +752,17 @@ def ask_question_retrieval_chunks(
     tree = load_tree(tree_path)
     actions = []
 
-    total_context = ""
-    for key in tree['pages'].keys():
-        total_context += tree['pages'][key] + " "
-    
-    chunks = divide_into_chunks(total_context, 100)
-    context = perform_retrieval(question, chunks)
+    # Chunks, and the indexes over them, are built once per document and
+    # reused by every question about it.
+    backend = SEARCH_BACKEND
+    chunks = [chunk.text for chunk in document_chunks(tree)]
+    lexical_index = vector_store = None
+    if backend in ("bm25", "hybrid"):
+        lexical_index = derived(tree, "chunk_bm25", lambda t: BM25Index.build(dict(enumerate(chunks))))
+    if backend in ("embedding", "hybrid"):
+        embedder = get_embedding_backend()
+        vector_store = derived(tree, f"chunk_vectors:{embedder.name}", lambda t: VectorStore(embedder.embed(chunks)))
+    context = perform_retrieval(question, chunks, backend, lexical_index, vector_store)
 
     messages = [
         {
@@ -452,7 +777,7 @@ You are an expert document question answering system. You answer questions by fi
         }
     ]
 
-    response = openai.ChatCompletion.create(
+    response = chat_completion(
             model="gpt-3.5-turbo", #"gpt-3.5-turbo-0613",
             messages=messages,
             #functions=functions,
@@ -10,9 +10,22 @@ Outputs of evaluation:
 - was the answer correct to the document
 """
 
-import openai
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import asyncio
+import time
+
 import backoff
-from functions import fetch_all, ask_question, ask_question_truncation, ask_question_retrieval_pages, ask_question_retrieval_chunks
+import click
+import jsonlines
+import openai
+from functions import fetch_all, ask_question, ask_question_truncation, ask_question_retrieval_pages, ask_question_retrieval_chunks, chat_completion
+from document_cache import get_document_cache
+from embedding_backends import EMBEDDING_BACKENDS, make_embedding_backend, set_embedding_backend
+from completion_cache import MODES, CompletionCache, get_completion_cache, set_completion_cache
+from rate_limit import RateLimiter, get_rate_limiter, set_rate_limiter
 
 def load_prompt():
     pass
@@ -30,7 +43,7 @@ def evaluate(
         question: str,
 ) -> list[str]:
     
-    _response = openai.ChatCompletion.create(
+    _response = chat_completion(
         model="gpt-3.5-turbo-16k",
         messages=[
                     { "role": "system", "content": context},
@@ -54,57 +67,131 @@ def evaluate(
 
 ################################################
 
-import jsonlines
-import ast
-import json
-
-saved_responses = []
-count = 0
- 
-with jsonlines.open('data/question_filtered.jsonl', 'r') as reader:
-    for line in reader:
-
-        if count < 3:
-            count += 1
-        
-            current_dict = line
-            
-            pdf_url_parsed = line['pdf_url'].split("/")
-            extract_path = ("data/valid_json/" + pdf_url_parsed[-1]).replace(".pdf", ".json")
-            tree_pdf_path = ("data/valid_metadata/" + pdf_url_parsed[-1]).replace(".pdf", "-metadata.json")
-
-            try:
-
-                responses = ask_question(current_dict['text'], extract_path, tree_pdf_path)
-                truncation_responses = ask_question_truncation(current_dict['text'], extract_path, tree_pdf_path)
-                retrieval_pages_responses = ask_question_retrieval_pages(current_dict['text'], extract_path, tree_pdf_path)
-                retrieval_chunks_responses = ask_question_retrieval_chunks(current_dict['text'], extract_path, tree_pdf_path)
-
-                print("PDF Path")
-                print(extract_path)
-                print("Question")
-                print(current_dict['text'])
-                print("GPTriage Responses")
-                print(responses)
-                print("Truncation Responses")
-                print(truncation_responses)
-                print("Retrieval Pages Responses")
-                print(retrieval_pages_responses)
-                print("Retrieval Chunks Responses")
-                print(retrieval_chunks_responses)
-                print("------------------------------------------")
-
-                saved_responses.append([extract_path, current_dict['text'], responses, truncation_responses, 
-                                        retrieval_pages_responses, retrieval_chunks_responses])
-
-            except Exception as e:
-                print("Error with following path: " + str(extract_path))
-                print("------------------------------------------")
-
-##################################################
-
-import pandas as pd
-df = pd.DataFrame(saved_responses, columns=['PDF_Path', 'Question', 'GPT_Triage_Responses', 'Truncation_Responses',
-                                            'Retrieval_by_Pages_Responses', 'Retrieval_by_Chunks_Responses'])
-df.to_csv('data/saved_responses_for_validation.csv', index=False)
-        
\ No newline at end of file
+STRATEGIES = {
+    'GPT_Triage_Responses': ask_question,
+    'Truncation_Responses': ask_question_truncation,
+    'Retrieval_by_Pages_Responses': ask_question_retrieval_pages,
+    'Retrieval_by_Chunks_Responses': ask_question_retrieval_chunks,
+}
+
+
+def document_paths(
+        pdf_url: str
+) -> tuple[str, str]:
+    pdf_url_parsed = pdf_url.split("/")
+    extract_path = ("data/valid_json/" + pdf_url_parsed[-1]).replace(".pdf", ".json")
+    tree_pdf_path = ("data/valid_metadata/" + pdf_url_parsed[-1]).replace(".pdf", "-metadata.json")
+    return extract_path, tree_pdf_path
+
+
+async def run_strategy(
+        semaphore: asyncio.Semaphore,
+        strategy,
+        question: str,
+        extract_path: str,
+        tree_path: str,
+) -> tuple[str | tuple | None, str | None, float]:
+    """
+    Runs one blocking strategy in the worker pool. Errors are returned rather
+    than raised so one failing strategy doesn't cancel the rest of the run.
+    """
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(strategy, question, extract_path, tree_path)
+            return result, None, time.perf_counter() - start
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+async def run_evaluation(
+        questions: list[dict],
+        strategies: dict = STRATEGIES,
+        concurrency: int = 16,
+) -> list[dict]:
+    """
+    Answers every question with every strategy, running up to `concurrency`
+    (question, strategy) pairs at once. Rate limits are enforced separately
+    inside `chat_completion` by the process-wide RateLimiter.
+    """
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_question(question: dict) -> dict:
+        extract_path, tree_pdf_path = document_paths(question['pdf_url'])
+        outcomes = await asyncio.gather(*[
+            run_strategy(semaphore, strategy, question['text'], extract_path, tree_pdf_path)
+            for strategy in strategies.values()
+        ])
+
+        row = {'PDF_Path': extract_path, 'Question': question['text']}
+        for name, (result, error, seconds) in zip(strategies, outcomes):
+            row[name] = result if error is None else None
+            row[name.replace('_Responses', '_Error')] = error
+            row[name.replace('_Responses', '_Seconds')] = round(seconds, 3)
+            if error is not None:
+                print(f"Error with {name} for {extract_path}: {error}")
+        return row
+
+    return await asyncio.gather(*[run_question(question) for question in questions])
+
+
+@click.command()
+@click.option("--questions", "questions_path", type=Path, default="data/question_filtered.jsonl", show_default=True)
+@click.option("--output", "output_path", type=Path, default="data/saved_responses_for_validation.csv", show_default=True)
+@click.option("--limit", type=int, default=3, show_default=True, help="Number of questions to evaluate.")
+@click.option("--concurrency", type=int, default=16, show_default=True)
+@click.option("--rpm", type=float, default=None, help="Chat-completion requests per minute.")
+@click.option("--tpm", type=float, default=None, help="Chat-completion tokens per minute.")
+@click.option("--api-base", default=None, help="e.g. the URL printed by stub_openai_server.py.")
+@click.option("--cache-mode", type=click.Choice(MODES), default=None,
+              help="Record/replay chat completions; defaults to $PDFTRIAGE_COMPLETION_CACHE_MODE.")
+@click.option("--cache-path", type=Path, default=None, help="SQLite file for recorded completions.")
+@click.option("--embedding-backend", type=click.Choice(sorted(EMBEDDING_BACKENDS)), default=None,
+              help="Embeddings for retrieval; defaults to $PDFTRIAGE_EMBEDDING_BACKEND or openai.")
+def main(
+        questions_path: Path,
+        output_path: Path,
+        limit: int,
+        concurrency: int,
+        rpm: float | None,
+        tpm: float | None,
+        api_base: str | None,
+        cache_mode: str | None,
+        cache_path: Path | None,
+        embedding_backend: str | None,
+):
+    if api_base:
+        openai.api_base = api_base
+        openai.api_key = openai.api_key or "stub"
+    if rpm or tpm:
+        set_rate_limiter(RateLimiter(requests_per_minute=rpm, tokens_per_minute=tpm))
+    if cache_mode or cache_path:
+        cache_kwargs = {"mode": cache_mode, "path": cache_path}
+        set_completion_cache(CompletionCache(**{k: v for k, v in cache_kwargs.items() if v is not None}))
+    if embedding_backend:
+        set_embedding_backend(make_embedding_backend(embedding_backend))
+
+    with jsonlines.open(questions_path, 'r') as reader:
+        questions = [line for _, line in zip(range(limit), reader)]
+
+    start = time.perf_counter()
+    saved_responses = asyncio.run(run_evaluation(questions, concurrency=concurrency))
+    elapsed = time.perf_counter() - start
+
+    print(f"Evaluated {len(questions)} questions x {len(STRATEGIES)} strategies in {elapsed:.1f}s")
+    print(f"Completion cache: {get_completion_cache().stats()}")
+    print(f"Document cache: {get_document_cache().stats()}")
+    limiter = get_rate_limiter()
+    if limiter is not None:
+        print(f"Rate limiter: {limiter.requests} requests, ~{limiter.tokens} tokens, "
+              f"{limiter.waited_seconds:.1f}s spent waiting")
+
+    import pandas as pd
+    df = pd.DataFrame(saved_responses)
+    df.to_csv(output_path, index=False)
+
+
+if __name__ == '__main__':
+    main()
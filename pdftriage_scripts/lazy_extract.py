@@ -0,0 +1,112 @@
+"""
+Lazy handle on an Adobe Extract JSON file.
+
+The Extract JSON is usually the largest file per document and none of the
+question-answering tools read it, so `load_extract` hands out a LazyExtract
+that touches the file only when an element is actually accessed:
+
+- indexing or slicing from the front streams elements with
+  `scan_extract_elements` and stops as soon as the range is read; the byte
+  offset of every element passed is kept, so later reads start from the
+  nearest element already seen instead of the top of the file
+- iterating streams the whole file without keeping it in memory
+- anything else (len, negative indexes) parses the file once, through the
+  process-wide document cache, and serves from the parsed elements after that
+"""
+from __future__ import annotations
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Iterator
+
+import json
+import threading
+
+from document_cache import freeze, get_document_cache, resident_bytes
+from extract_metadata import iter_extract_elements, scan_extract_elements
+
+
+def read_extract(
+        extract_path: Path
+) -> tuple[tuple[dict, ...], int]:
+    """
+    Document cache loader: the frozen elements and their resident size.
+    """
+    with extract_path.open() as f_extract:
+        extract = json.load(f_extract)
+
+    elements = freeze(extract['elements'])
+    return elements, resident_bytes(elements)
+
+
+class LazyExtract(Sequence):
+
+    def __init__(
+            self,
+            path: str | Path,
+    ) -> None:
+        self.path = Path(path)
+        self._elements = None
+        self._lock = threading.Lock()
+        # Byte offsets of elements 0, 1, ... as far as any read has got.
+        self._offsets: list[int] = []
+
+    @property
+    def loaded(self) -> bool:
+        return self._elements is not None
+
+    @property
+    def elements(self) -> tuple[dict, ...]:
+        """
+        Every element, parsing the file on first use.
+        """
+        if self._elements is None:
+            with self._lock:
+                if self._elements is None:
+                    self._elements = get_document_cache().get("extract", self.path, read_extract)
+        return self._elements
+
+    def _stream(
+            self,
+            start: int,
+            stop: int,
+    ) -> list[dict]:
+        if stop <= start:
+            return []
+        known = min(start, len(self._offsets) - 1)
+        offset = self._offsets[known] if known >= 0 else None
+
+        elements = []
+        for ix, (offset, element) in enumerate(scan_extract_elements(self.path, offset), max(known, 0)):
+            if ix == len(self._offsets):
+                with self._lock:
+                    if ix == len(self._offsets):
+                        self._offsets.append(offset)
+            if ix >= start:
+                elements.append(freeze(element))
+            if ix == stop - 1:
+                break
+        return elements
+
+    def __getitem__(self, ix):
+        if self._elements is None:
+            if isinstance(ix, slice):
+                if ix.step in (None, 1) and (ix.start or 0) >= 0 and ix.stop is not None and ix.stop >= 0:
+                    return tuple(self._stream(ix.start or 0, ix.stop))
+            elif ix >= 0:
+                elements = self._stream(ix, ix + 1)
+                if not elements:
+                    raise IndexError(ix)
+                return elements[0]
+        return self.elements[ix]
+
+    def __iter__(self) -> Iterator[dict]:
+        if self._elements is not None:
+            return iter(self._elements)
+        return (freeze(element) for element in iter_extract_elements(self.path))
+
+    def __len__(self) -> int:
+        return len(self.elements)
+
+    def __repr__(self) -> str:
+        state = f"{len(self._elements)} elements" if self._elements is not None else "not loaded"
+        return f"LazyExtract({str(self.path)!r}, {state})"
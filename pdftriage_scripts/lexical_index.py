@@ -0,0 +1,207 @@
+"""
+In-process BM25 index over a document's pages.
+
+Postings keep token positions, so quoted phrases in a query ("table 4.2")
+only match pages where the words appear consecutively. The index is small
+enough to serialize as JSON next to the document's -metadata.json.
+"""
+from __future__ import annotations
+from pathlib import Path
+
+import json
+import math
+import re
+
+import numpy
+
+
+# Keep part numbers, decimals and acronyms like "A-12.5" or "U.S." together.
+TOKEN_RE = re.compile(r"\w+(?:[.\-/]\w+)*")
+PHRASE_RE = re.compile(r'"([^"]+)"')
+
+INDEX_VERSION = 1
+
+
+def tokenize(
+        text: str
+) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def index_path_for(
+        tree_path: str | Path
+) -> Path:
+    tree_path = Path(tree_path)
+    return tree_path.with_name(tree_path.stem + ".bm25.json")
+
+
+class BM25Index:
+
+    def __init__(
+            self,
+            doc_ids: list[str],
+            doc_lengths: list[int],
+            postings: dict[str, dict[int, list[int]]],
+            k1: float = 1.5,
+            b: float = 0.75,
+    ) -> None:
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+
+        lengths = numpy.asarray(doc_lengths, dtype=numpy.float32)
+        average = lengths.mean() if len(lengths) else 0.0
+        self._norms = k1 * (1 - b + b * (lengths / average if average else 0.0))
+        self._impacts = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(
+            cls,
+            documents: dict,
+            k1: float = 1.5,
+            b: float = 0.75,
+    ) -> BM25Index:
+        """
+        Indexes a mapping of page id -> text, e.g. `tree['pages']`. Ids are
+        stored as strings, matching the keys of a JSON-loaded tree.
+        """
+        doc_ids = []
+        doc_lengths = []
+        postings = {}
+        for doc, (doc_id, text) in enumerate(documents.items()):
+            tokens = tokenize(text)
+            doc_ids.append(str(doc_id))
+            doc_lengths.append(len(tokens))
+            for position, token in enumerate(tokens):
+                postings.setdefault(token, {}).setdefault(doc, []).append(position)
+        return cls(doc_ids, doc_lengths, postings, k1, b)
+
+    def _idf(
+            self,
+            term: str
+    ) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.doc_ids) - df + 0.5) / (df + 0.5))
+
+    def _term_impacts(
+            self,
+            term: str
+    ) -> tuple[numpy.ndarray, numpy.ndarray] | None:
+        """
+        The BM25 contribution of `term` to every page containing it doesn't
+        depend on the query, so it is computed once per term and reused.
+        """
+        impacts = self._impacts.get(term)
+        if impacts is None:
+            postings = self.postings.get(term)
+            if not postings:
+                return None
+            docs = numpy.fromiter(postings.keys(), dtype=numpy.int64, count=len(postings))
+            tf = numpy.fromiter((len(p) for p in postings.values()), dtype=numpy.float32, count=len(postings))
+            weights = self._idf(term) * tf * (self.k1 + 1) / (tf + self._norms[docs])
+            impacts = self._impacts[term] = (docs, weights)
+        return impacts
+
+    def _contains_phrase(
+            self,
+            doc: int,
+            phrase: list[str],
+    ) -> bool:
+        starts = self.postings.get(phrase[0], {}).get(doc)
+        if not starts:
+            return False
+        candidates = set(starts)
+        for offset, term in enumerate(phrase[1:], start=1):
+            positions = self.postings.get(term, {}).get(doc)
+            if not positions:
+                return False
+            candidates &= {p - offset for p in positions}
+            if not candidates:
+                return False
+        return True
+
+    def search(
+            self,
+            query: str,
+            k: int = 4,
+    ) -> list[tuple[float, str]]:
+        """
+        Returns up to `k` (score, page id) pairs, best first. Quoted phrases
+        must match exactly; all query terms contribute to the BM25 score.
+        """
+        if k <= 0:
+            return []
+        phrases = [tokenize(p) for p in PHRASE_RE.findall(query)]
+        phrases = [p for p in phrases if p]
+        terms = set(tokenize(query))
+
+        scores = numpy.zeros(len(self.doc_ids), dtype=numpy.float32)
+        matched = numpy.zeros(len(self.doc_ids), dtype=bool)
+        for term in terms:
+            impacts = self._term_impacts(term)
+            if impacts is not None:
+                docs, weights = impacts
+                scores[docs] += weights
+                matched[docs] = True
+
+        candidates = numpy.flatnonzero(matched)
+        if not phrases and len(candidates) > k:
+            candidates = candidates[numpy.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[numpy.argsort(-scores[candidates], kind="stable")]
+
+        # Phrase checks are the expensive part, so only run them in score
+        # order until k pages have matched.
+        results = []
+        for doc in candidates.tolist():
+            if phrases and not all(self._contains_phrase(doc, phrase) for phrase in phrases):
+                continue
+            results.append((float(scores[doc]), self.doc_ids[doc]))
+            if len(results) == k:
+                break
+        return results
+
+    def to_dict(self) -> dict:
+        return {
+            "version": INDEX_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "doc_ids": self.doc_ids,
+            "doc_lengths": self.doc_lengths,
+            "postings": {
+                term: [[doc, positions] for doc, positions in docs.items()]
+                for term, docs in self.postings.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(
+            cls,
+            data: dict
+    ) -> BM25Index:
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported BM25 index version {data.get('version')}")
+        postings = {
+            term: {doc: positions for doc, positions in docs}
+            for term, docs in data["postings"].items()
+        }
+        return cls(data["doc_ids"], data["doc_lengths"], postings, data["k1"], data["b"])
+
+    def save(
+            self,
+            path: str | Path
+    ) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+
+    @classmethod
+    def load(
+            cls,
+            path: str | Path
+    ) -> BM25Index:
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
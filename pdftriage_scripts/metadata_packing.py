@@ -0,0 +1,216 @@
+"""
+Fit the document metadata that `ask_question` puts in its system prompt into
+the model's context window.
+
+Representations are tried from most to least detailed until one fits:
+
+- "full": every page and section with its full text (the original prompt)
+- "truncated": page and section text cut to the first 256 words each
+- "toc": section titles with page ranges, plus the list of page numbers
+- "summarized_toc": runs of consecutive sections folded into one entry each,
+  doubling the run length until the table of contents fits
+
+Tokens are counted with tiktoken, which downloads its encodings on first
+use. PDFTRIAGE_TOKENIZER=words (or `set_tokenizer("words")`) counts regex
+words and punctuation instead, and that is also the fallback, with a
+warning, when the tiktoken encoding can't be loaded.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from functools import lru_cache
+
+import json
+import os
+import re
+import warnings
+
+import tiktoken
+
+
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-0613": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-3.5-turbo-16k-0613": 16384,
+    "gpt-4": 8192,
+    "gpt-4-0613": 8192,
+    "gpt-4-32k": 32768,
+}
+
+TOKENIZERS = ("tiktoken", "words")
+TOKENIZER = os.environ.get("PDFTRIAGE_TOKENIZER", "tiktoken")
+
+TRUNCATED_WORDS = 256
+MAX_TITLE_CHARS = 80
+
+
+@dataclass
+class PackedMetadata:
+    text: str
+    level: str
+    tokens: int
+    budget: int
+
+
+class WordEncoder:
+    """
+    The encode/decode subset of tiktoken.Encoding over regex words and
+    punctuation marks. Each token keeps its leading whitespace, so decoding
+    a slice gives back that span of the text. Counts run below BPE counts
+    for English prose, so budgets sized in tiktoken tokens are approximate.
+    """
+
+    pattern = re.compile(r"\s*(?:\w+|[^\w\s])")
+
+    def encode(
+            self,
+            text: str,
+            disallowed_special=(),
+    ) -> list[str]:
+        return self.pattern.findall(text)
+
+    def decode(
+            self,
+            tokens: list[str],
+    ) -> str:
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=None)
+def get_encoder(
+        model: str
+) -> tiktoken.Encoding | WordEncoder:
+    if TOKENIZER == "words":
+        return WordEncoder()
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except (OSError, ValueError) as e:
+        warnings.warn(f"Can't load the tiktoken encoding for {model} ({type(e).__name__}); "
+                      f"counting words instead")
+        return WordEncoder()
+
+
+def set_tokenizer(
+        name: str
+) -> None:
+    global TOKENIZER
+    if name not in TOKENIZERS:
+        raise ValueError(f"Unknown tokenizer {name!r}; expected one of {TOKENIZERS}")
+    TOKENIZER = name
+    get_encoder.cache_clear()
+
+
+def count_tokens(
+        text: str,
+        model: str = "gpt-3.5-turbo",
+) -> int:
+    return len(get_encoder(model).encode(text, disallowed_special=()))
+
+
+def truncate_tokens(
+        text: str,
+        max_tokens: int,
+        model: str = "gpt-3.5-turbo",
+) -> str:
+    encoder = get_encoder(model)
+    tokens = encoder.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoder.decode(tokens[:max_tokens])
+
+
+def context_window(
+        model: str
+) -> int:
+    return MODEL_CONTEXT_WINDOWS.get(model, 4096)
+
+
+def page_ranges(
+        pages: list[int]
+) -> str:
+    """
+    [1, 2, 3, 5, 7, 8] -> "1-3, 5, 7-8"
+    """
+    numbers = sorted({int(p) for p in pages})
+    ranges = []
+    for page in numbers:
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def _short_title(
+        title: str | None
+) -> str:
+    title = (title or "").strip() or "(untitled)"
+    return title if len(title) <= MAX_TITLE_CHARS else title[:MAX_TITLE_CHARS - 3] + "..."
+
+
+def _truncate_words(
+        text: str
+) -> str:
+    return (" ").join(text.split(" ")[:TRUNCATED_WORDS])
+
+
+def _candidates(
+        tree: dict
+):
+    pages = dict(tree['pages'])
+    sections = [dict(section) for section in tree['sections']]
+
+    yield "full", {'pages': pages, 'sections': sections}
+
+    yield "truncated", {
+        'pages': {key: _truncate_words(text) for key, text in pages.items()},
+        'sections': [dict(section, text=_truncate_words(section['text'])) for section in sections],
+    }
+
+    page_numbers = page_ranges(pages.keys()) if pages else ""
+    yield "toc", {
+        'pages': page_numbers,
+        'sections': [
+            {'title': _short_title(section['title']), 'pages': page_ranges(section['pages'])}
+            for section in sections
+        ],
+    }
+
+    group = 2
+    while True:
+        groups = []
+        for start in range(0, len(sections), group):
+            run = sections[start:start + group]
+            title = _short_title(run[0]['title'])
+            if len(run) > 1:
+                title += f" (+{len(run) - 1} more sections)"
+            groups.append({
+                'title': title,
+                'pages': page_ranges([p for section in run for p in section['pages']]),
+            })
+        yield "summarized_toc", {'pages': page_numbers, 'sections': groups}
+        if group >= len(sections):
+            return
+        group *= 2
+
+
+def pack_metadata(
+        tree: dict,
+        budget: int,
+        model: str = "gpt-3.5-turbo-16k",
+) -> PackedMetadata:
+    """
+    Returns the most detailed JSON representation of the tree's metadata that
+    fits in `budget` tokens. If even the coarsest table of contents doesn't
+    fit, that is returned anyway and the caller sees tokens > budget.
+    """
+    packed = None
+    for level, metadata in _candidates(tree):
+        text = json.dumps(metadata)
+        packed = PackedMetadata(text=text, level=level, tokens=count_tokens(text, model), budget=budget)
+        if packed.tokens <= budget:
+            break
+    return packed
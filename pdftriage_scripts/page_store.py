@@ -0,0 +1,116 @@
+"""
+Page text stored as one contiguous UTF-8 buffer with an offset table.
+
+Page `page_numbers[i]` is `buffer[offsets[i]:offsets[i + 1]]`, so fetching k
+pages decodes k slices instead of scanning the document. Page identifiers
+from the model are normalized first: 3, 3.0, "3", "3.0", "10-40" and
+"pages 10-40, 45" are all accepted.
+"""
+from __future__ import annotations
+from array import array
+from typing import Iterable
+
+import re
+
+
+PAGE_SPEC_RE = re.compile(r"(\d+)(?:\s*(?:-|–|—|to)\s*(\d+))?")
+THOUSANDS_RE = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?")
+MAX_RANGE_PAGES = 10_000
+
+
+def parse_pages(
+        pages: int | float | str | Iterable[int | float | str]
+) -> list[int]:
+    """
+    Normalizes page identifiers to ints, expanding ranges and dropping
+    anything that isn't a page number. Order is preserved, duplicates removed.
+    """
+    if isinstance(pages, (int, float, str)):
+        pages = [pages]
+
+    numbers = []
+    for page in pages:
+        if isinstance(page, bool):
+            continue
+        if isinstance(page, str):
+            # A string that is one number ("3.0", "3.5", "1,000") is treated
+            # like a numeric item, not split on its punctuation.
+            text = page.strip()
+            if THOUSANDS_RE.fullmatch(text):
+                text = text.replace(",", "")
+            try:
+                page = float(text)
+            except ValueError:
+                pass
+        if isinstance(page, (int, float)):
+            if float(page).is_integer():
+                numbers.append(int(page))
+            continue
+        for start, end in PAGE_SPEC_RE.findall(str(page)):
+            start = int(start)
+            end = int(end) if end else start
+            if end < start:
+                start, end = end, start
+            numbers.extend(range(start, min(end, start + MAX_RANGE_PAGES) + 1))
+    return list(dict.fromkeys(numbers))
+
+
+class PageStore:
+
+    def __init__(
+            self,
+            buffer: bytes | memoryview,
+            page_numbers: Iterable[int],
+            offsets: Iterable[int],
+    ) -> None:
+        self.buffer = memoryview(buffer)
+        self.page_numbers = array('q', page_numbers)
+        self.offsets = array('q', offsets)
+        self._positions = {page: ix for ix, page in enumerate(self.page_numbers)}
+
+    @classmethod
+    def from_pages(
+            cls,
+            pages: dict,
+    ) -> PageStore:
+        """
+        Builds a store from a page -> text mapping such as `tree['pages']`,
+        keeping the mapping's order.
+        """
+        page_numbers = []
+        offsets = [0]
+        chunks = []
+        for page, text in pages.items():
+            encoded = text.encode("utf-8")
+            page_numbers.append(int(page))
+            chunks.append(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+        return cls(b"".join(chunks), page_numbers, offsets)
+
+    def __len__(self) -> int:
+        return len(self.page_numbers)
+
+    def __contains__(self, page: int) -> bool:
+        return page in self._positions
+
+    def page(
+            self,
+            page: int,
+    ) -> str | None:
+        ix = self._positions.get(page)
+        if ix is None:
+            return None
+        return str(self.buffer[self.offsets[ix]:self.offsets[ix + 1]], "utf-8")
+
+    def fetch(
+            self,
+            pages,
+    ) -> list[tuple[int, str]]:
+        """
+        (page, text) for every requested page that exists, in document order.
+        """
+        positions = sorted(self._positions[p] for p in parse_pages(pages) if p in self._positions)
+        return [
+            (self.page_numbers[ix], str(self.buffer[self.offsets[ix]:self.offsets[ix + 1]], "utf-8"))
+            for ix in positions
+        ]
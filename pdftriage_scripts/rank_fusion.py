@@ -0,0 +1,29 @@
+"""
+Reciprocal-rank fusion of ranked result lists from different retrievers.
+"""
+from __future__ import annotations
+from typing import Hashable
+
+
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(
+        rankings: dict[str, list[tuple[float, Hashable]]],
+        k: int,
+        rrf_k: int = RRF_K,
+) -> list[dict]:
+    """
+    Merges {source: [(score, id), ...] best first} into the top `k` ids by
+    sum(1 / (rrf_k + rank)). Each result keeps the score and 1-based rank it
+    had in every source that returned it.
+    """
+    fused = {}
+    for source, ranking in rankings.items():
+        for rank, (score, id) in enumerate(ranking, start=1):
+            entry = fused.setdefault(id, {"id": id, "score": 0.0})
+            entry["score"] += 1.0 / (rrf_k + rank)
+            entry[f"{source}_score"] = float(score)
+            entry[f"{source}_rank"] = rank
+
+    return sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)[:k]
@@ -0,0 +1,110 @@
+"""
+Client-side request and token rate limiting for chat-completion calls.
+
+The limiter is process-wide and thread-safe: every `chat_completion` call in
+functions.py acquires from it before going to the API, so any number of
+concurrent evaluation workers stay within the account's limits.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token buckets for requests per minute and tokens per minute. Each bucket
+    holds at most `burst_seconds` worth of its rate.
+    """
+
+    def __init__(
+            self,
+            requests_per_minute: float | None = None,
+            tokens_per_minute: float | None = None,
+            burst_seconds: float = 10.0,
+    ) -> None:
+        self._buckets = {}
+        for name, per_minute in [("requests", requests_per_minute), ("tokens", tokens_per_minute)]:
+            if per_minute:
+                rate = per_minute / 60.0
+                capacity = max(1.0, rate * burst_seconds)
+                self._buckets[name] = {"rate": rate, "capacity": capacity, "level": capacity}
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.tokens = 0
+        self.waited_seconds = 0.0
+
+    def acquire(
+            self,
+            tokens: int = 0,
+    ) -> float:
+        """
+        Blocks until one request and `tokens` tokens are available, and
+        returns how long it waited.
+        """
+        wanted = {"requests": 1.0, "tokens": float(tokens)}
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed, self._updated = now - self._updated, now
+                for bucket in self._buckets.values():
+                    bucket["level"] = min(bucket["capacity"], bucket["level"] + elapsed * bucket["rate"])
+
+                # A single request larger than the bucket is let through once
+                # the bucket is full rather than blocking forever.
+                shortfall = 0.0
+                for name, bucket in self._buckets.items():
+                    need = min(wanted[name], bucket["capacity"])
+                    if bucket["level"] < need:
+                        shortfall = max(shortfall, (need - bucket["level"]) / bucket["rate"])
+
+                if shortfall == 0.0:
+                    for name, bucket in self._buckets.items():
+                        bucket["level"] -= min(wanted[name], bucket["capacity"])
+                    self.requests += 1
+                    self.tokens += tokens
+                    self.waited_seconds += waited
+                    return waited
+
+            time.sleep(shortfall)
+            waited += shortfall
+
+
+def estimate_request_tokens(
+        request: dict,
+) -> int:
+    """
+    Rough token count of a chat-completion request, using the same ~4
+    characters per token approximation the API's own rate limiter uses, plus
+    the completion tokens it may produce.
+    """
+    prompt_chars = 0
+    for message in request.get("messages", []):
+        prompt_chars += len(str(message.get("content") or ""))
+        # Assistant turns that called tools carry their arguments here.
+        for field in ("tool_calls", "function_call"):
+            if message.get(field):
+                prompt_chars += len(json.dumps(message[field]))
+    for field in ("functions", "tools"):
+        if request.get(field):
+            prompt_chars += len(json.dumps(request[field]))
+    completion_tokens = (request.get("max_tokens") or 0) * (request.get("n") or 1)
+    return prompt_chars // 4 + completion_tokens
+
+
+_limiter: RateLimiter | None = None
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    return _limiter
+
+
+def set_rate_limiter(
+        limiter: RateLimiter | None
+) -> None:
+    global _limiter
+    _limiter = limiter
@@ -0,0 +1,104 @@
+"""
+Section-title lookup for `fetch_section`.
+
+The model rarely repeats a title exactly as it appears in the metadata: it
+drops or adds numbering ("3 Tree of Thoughts"), trailing spaces, or cuts the
+title short with "...". Lookups try, in order:
+
+- the exact title
+- a normalized title: case, numbering, punctuation and whitespace removed
+- fuzzy matching on character trigrams of the normalized title
+"""
+from __future__ import annotations
+from collections import Counter
+
+import re
+import unicodedata
+
+
+NUMBERING_RE = re.compile(r"^(?:\d+(?:\.\d+)*\.?|[ivxlcdm]+[.)]|[a-z][.)])\s+", re.IGNORECASE)
+NON_WORD_RE = re.compile(r"[\W_]+")
+
+MIN_DICE = 0.5
+MIN_COVERAGE = 0.8
+
+
+def normalize_title(
+        title: str | None
+) -> str:
+    title = unicodedata.normalize("NFKC", title or "").strip()
+    title = NUMBERING_RE.sub("", title)
+    return NON_WORD_RE.sub(" ", title.lower()).strip()
+
+
+def trigrams(
+        text: str
+) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SectionIndex:
+
+    def __init__(
+            self,
+            sections: list[dict],
+    ) -> None:
+        self.sections = sections
+        self.exact = {}
+        self.normalized = {}
+        self.grams = {}
+        self._gram_counts = []
+
+        for ix, section in enumerate(sections):
+            title = section['title'] or ""
+            self.exact.setdefault(title, []).append(ix)
+
+            normalized = normalize_title(title)
+            self.normalized.setdefault(normalized, []).append(ix)
+
+            grams = trigrams(normalized) if normalized else set()
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self.grams.setdefault(gram, []).append(ix)
+
+    def lookup(
+            self,
+            title: str,
+    ) -> list[int]:
+        """
+        Indexes of the sections matching `title`. Exact and normalized matches
+        return every section with that title; fuzzy matching returns the single
+        best section, or nothing if no title is close enough.
+        """
+        if title in self.exact:
+            return self.exact[title]
+
+        normalized = normalize_title(title)
+        if not normalized:
+            return []
+        if normalized in self.normalized:
+            return self.normalized[normalized]
+
+        query = trigrams(normalized)
+        shared = Counter(ix for gram in query for ix in self.grams.get(gram, ()))
+
+        best, best_score = None, 0.0
+        for ix, overlap in shared.items():
+            dice = 2 * overlap / (len(query) + self._gram_counts[ix])
+            # Coverage catches titles the model cut short.
+            coverage = overlap / len(query)
+            if dice < MIN_DICE and coverage < MIN_COVERAGE:
+                continue
+            if dice + coverage > best_score:
+                best, best_score = ix, dice + coverage
+        return [best] if best is not None else []
+
+    def text(
+            self,
+            title: str,
+    ) -> str:
+        content = ""
+        for ix in self.lookup(title):
+            content = content + " " + self.sections[ix]['text']
+        return content.strip()
@@ -0,0 +1,163 @@
+"""
+Local stand-in for the OpenAI chat-completion and embedding endpoints, for
+load-testing the evaluation harness and embedder without network access or
+cost. Responses are canned; each request sleeps for --latency seconds.
+
+    python stub_openai_server.py --port 8089 --latency 0.5
+    python gpt_evaluate.py --api-base http://127.0.0.1:8089/v1 --limit 1000
+"""
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import hashlib
+import json
+import threading
+import time
+
+import click
+import numpy
+
+
+# Same per-request input limit as the real embeddings endpoint.
+MAX_EMBEDDING_INPUTS = 2048
+
+
+class StubState:
+
+    def __init__(
+            self,
+            latency: float,
+            dim: int,
+            text_latency: float = 0.0,
+    ) -> None:
+        self.latency = latency
+        self.dim = dim
+        self.text_latency = text_latency
+        self.lock = threading.Lock()
+        self.counts = {"chat": 0, "embeddings": 0, "embedded_texts": 0}
+
+
+def stub_embedding(
+        text: str,
+        dim: int,
+) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = numpy.random.default_rng(seed).standard_normal(dim)
+    return (vector / numpy.linalg.norm(vector)).tolist()
+
+
+def make_handler(
+        state: StubState
+) -> type[BaseHTTPRequestHandler]:
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status: int, body: dict) -> None:
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                with state.lock:
+                    self._reply(200, dict(state.counts))
+            else:
+                self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(state.latency)
+
+            if self.path.endswith("/chat/completions"):
+                with state.lock:
+                    state.counts["chat"] += 1
+                prompt_tokens = sum(len(str(m.get("content") or "")) for m in request.get("messages", [])) // 4
+                self._reply(200, {
+                    "id": f"chatcmpl-stub-{state.counts['chat']}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [
+                        {
+                            "index": i,
+                            "message": {"role": "assistant", "content": "Stub answer."},
+                            "finish_reason": "stop",
+                        }
+                        for i in range(request.get("n") or 1)
+                    ],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 3,
+                              "total_tokens": prompt_tokens + 3},
+                })
+            elif self.path.endswith("/embeddings"):
+                texts = request.get("input", [])
+                if isinstance(texts, str):
+                    texts = [texts]
+                if len(texts) > MAX_EMBEDDING_INPUTS:
+                    self._reply(400, {"error": {"message": f"Too many inputs: {len(texts)} > {MAX_EMBEDDING_INPUTS}",
+                                                "type": "invalid_request_error"}})
+                    return
+                time.sleep(state.text_latency * len(texts))
+                with state.lock:
+                    state.counts["embeddings"] += 1
+                    state.counts["embedded_texts"] += len(texts)
+                self._reply(200, {
+                    "object": "list",
+                    "data": [
+                        {"object": "embedding", "index": i, "embedding": stub_embedding(text, state.dim)}
+                        for i, text in enumerate(texts)
+                    ],
+                    "model": request.get("model", "stub"),
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                })
+            else:
+                self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    return Handler
+
+
+def start_stub_server(
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        dim: int = 1536,
+        text_latency: float = 0.0,
+) -> tuple[ThreadingHTTPServer, str]:
+    """
+    Starts the stub in a background thread and returns the server and the
+    `api_base` URL to point the openai client at.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(StubState(latency, dim, text_latency)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=8089, show_default=True)
+@click.option("--latency", type=float, default=0.5, show_default=True, help="Seconds to sleep per request.")
+@click.option("--dim", type=int, default=1536, show_default=True, help="Embedding dimensions.")
+@click.option("--text-latency", type=float, default=0.0, show_default=True,
+              help="Extra seconds per embedded text, so larger batches take longer.")
+def main(
+        host: str,
+        port: int,
+        latency: float,
+        dim: int,
+        text_latency: float,
+):
+    server = ThreadingHTTPServer((host, port), make_handler(StubState(latency, dim, text_latency)))
+    server.daemon_threads = True
+    print(f"Stub OpenAI API on http://{host}:{port}/v1 ({latency}s latency)")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
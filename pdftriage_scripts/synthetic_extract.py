@@ -0,0 +1,96 @@
+"""
+Synthetic Adobe Extract output for benchmarks.
+
+Documents are shaped like real Extract JSON: a flat `elements` list whose
+`Path`s nest paragraphs, list items and table cells under numbered sections,
+with a heading opening each section.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any
+
+import json
+import random
+
+
+WORDS = (
+    "document section table figure value model result method data system "
+    "analysis page report input output process control device user setting "
+    "temperature pressure module interface signal level mode option error"
+).split()
+
+
+def synthetic_extract(
+        pages: int,
+        elements_per_page: int = 20,
+        sections_per_page: float = 0.5,
+        depth: int = 2,
+        words_per_element: int = 30,
+        seed: int = 0,
+) -> dict[str, Any]:
+    """
+    Builds an Extract document with `pages * elements_per_page` elements.
+    `depth` controls how deeply the non-heading elements are nested below
+    their section (1 means directly under it).
+    """
+    rng = random.Random(seed)
+    elements = []
+    section = 0
+    heading_every = max(1, round(elements_per_page / sections_per_page)) if sections_per_page > 0 else None
+    containers = ["L", "LI", "LBody", "Table", "TR", "TD", "Aside", "Div"]
+
+    for page in range(pages):
+        for ix in range(elements_per_page):
+            n = page * elements_per_page + ix
+            text = " ".join(rng.choice(WORDS) for _ in range(words_per_element)) + " "
+
+            if heading_every is not None and n % heading_every == 0:
+                section += 1
+                heading = "Title" if section == 1 else rng.choice(["H1", "H1", "H2"])
+                path = f"//Document/Sect[{section}]/{heading}" if section > 1 else "//Document/Title"
+                text = f"{section} {rng.choice(WORDS).title()} {rng.choice(WORDS)} "
+            else:
+                parts = [f"Sect[{section}]"] if section > 1 else []
+                for level in range(depth - 1):
+                    parts.append(f"{containers[(n + level) % len(containers)]}[{rng.randint(1, 4)}]")
+                parts.append(f"P[{ix + 1}]")
+                path = "//Document/" + "/".join(parts)
+
+            elements.append({
+                "Bounds": [72.0, 700.0 - ix * 10, 540.0, 710.0 - ix * 10],
+                "Font": {"family_name": "Times", "name": "Times-Roman", "weight": 400},
+                "Page": page,
+                "Path": path,
+                "Text": text,
+                "TextSize": 10.0,
+                "attributes": {"LineHeight": 12.0},
+            })
+
+        if rng.random() < 0.2:
+            elements.append({
+                "Bounds": [72.0, 100.0, 540.0, 300.0],
+                "Page": page,
+                "Path": f"//Document/Sect[{section}]/Figure",
+                "filePaths": [f"figures/fileoutpart{page}.png"],
+            })
+
+    return {
+        "version": {"json_export": "173", "page_segmentation": "5", "schema": "1.1.0"},
+        "extended_metadata": {"page_count": pages, "language": "en", "is_digital": True},
+        "elements": elements,
+        "pages": [
+            {"page_number": page, "width": 612.0, "height": 792.0, "rotation": 0}
+            for page in range(pages)
+        ],
+    }
+
+
+def write_synthetic_extract(
+        path: str | Path,
+        pages: int,
+        **kwargs,
+) -> Path:
+    path = Path(path)
+    with path.open("w") as fp:
+        json.dump(synthetic_extract(pages, **kwargs), fp)
+    return path